@@ -0,0 +1,231 @@
+"""
+Приближенный поиск ближайших соседей (IVF) на NumPy
+Для больших баз параграфов: вместо полного перебора сканируются только
+nprobe ближайших кластеров. API поиска совпадает с VectorIndex
+"""
+import hashlib
+import os
+
+import numpy as np
+
+from config import ANN_MIN_VECTORS, ANN_NLIST, ANN_NPROBE
+from retrieval import VectorIndex, top_k_indices
+
+# Кластеризация: обучение на выборке, разметка всех строк пачками
+TRAIN_POINTS_PER_LIST = 32
+TRAIN_ITERATIONS = 10
+ASSIGN_BATCH_SIZE = 8192
+
+
+def default_nlist(n):
+    """Число кластеров по умолчанию: ~sqrt(n)"""
+    return max(1, int(np.sqrt(n)))
+
+
+def matrix_checksum(matrix):
+    """Быстрая контрольная сумма матрицы (каждая ~n/64 строка) для проверки сохраненного индекса"""
+    step = max(1, matrix.shape[0] // 64)
+    digest = hashlib.sha256(str(matrix.shape).encode())
+    digest.update(np.ascontiguousarray(matrix[::step]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def assign_to_centroids(matrix, centroids):
+    """Ближайший центроид (по скалярному произведению) для каждой строки"""
+    assignments = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], ASSIGN_BATCH_SIZE):
+        batch = matrix[start:start + ASSIGN_BATCH_SIZE]
+        assignments[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(matrix, nlist, iterations=TRAIN_ITERATIONS, seed=0):
+    """Сферический k-means на случайной выборке строк"""
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    sample_size = min(n, nlist * TRAIN_POINTS_PER_LIST)
+    sample = matrix[rng.choice(n, sample_size, replace=False)] if sample_size < n else matrix
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign_to_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+        # Пустой кластер переинициализируем случайной точкой
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+
+    return np.ascontiguousarray(centroids, dtype=np.float32)
+
+
+class IVFIndex(VectorIndex):
+    def __init__(self, embeddings, labels=None, nlist=None, nprobe=ANN_NPROBE, centroids=None,
+                 order=None, offsets=None, seed=0):
+        """
+        Args:
+            nlist (int): Число кластеров (по умолчанию ~sqrt(n))
+            nprobe (int): Сколько ближайших кластеров сканировать - больше = точнее и медленнее
+            centroids, order, offsets: Готовая кластеризация (при загрузке с диска)
+        """
+        # Подматрицы разделов не копируем: при миллионе строк это удвоило бы память
+        super().__init__(embeddings)
+        n = len(self)
+        self.nprobe = nprobe
+        self.checksum = matrix_checksum(self.matrix)
+
+        if centroids is None:
+            nlist = min(nlist or default_nlist(n), n) if n else 0
+            centroids = train_centroids(self.matrix, nlist, seed=seed) if nlist else \
+                np.zeros((0, self.dim), dtype=np.float32)
+            assignments = assign_to_centroids(self.matrix, centroids)
+            order = np.argsort(assignments, kind='stable')
+            counts = np.bincount(assignments, minlength=len(centroids))
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+        # Строки лежат в матрице по кластерам: кластер = непрерывный срез
+        self.rows = np.asarray(order, dtype=np.int64)
+        self.positions = np.empty(n, dtype=np.int64)
+        self.positions[self.rows] = np.arange(n)
+        self.matrix = np.ascontiguousarray(self.matrix[self.rows])
+
+        # Разделы: номера строк и код раздела каждой строки для фильтрации кандидатов
+        self.label_codes = None
+        if labels is not None and len(labels) == n:
+            codes = {}
+            row_codes = np.empty(n, dtype=np.int64)
+            groups = {}
+            for row, label in enumerate(labels):
+                row_codes[row] = codes.setdefault(label, len(codes))
+                groups.setdefault(label, []).append(row)
+            self.label_codes = codes
+            self.row_codes = row_codes[self.rows]
+            for label, rows in groups.items():
+                self.partitions[label] = (np.asarray(rows, dtype=np.int64), None)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def scores(self, query_embedding):
+        """Точные оценки по всем строкам в исходном порядке"""
+        scores = np.empty(len(self), dtype=np.float32)
+        scores[self.rows] = self.matrix @ self.normalize_query(query_embedding)
+        return scores
+
+    def row_scores(self, query_embedding, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        return self.matrix[self.positions[rows]] @ self.normalize_query(query_embedding)
+
+    def exact_search(self, query_embedding, k, partitions=None):
+        """Полный перебор (эталон для оценки полноты)"""
+        if not partitions:
+            order, scores = top_k_indices(self.matrix @ self.normalize_query(query_embedding), k)
+            return self.rows[order], scores
+        rows = [self.partitions[label][0] for label in partitions if label in self.partitions]
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.concatenate(rows)
+        order, scores = top_k_indices(self.row_scores(query_embedding, rows), k)
+        return rows[order], scores
+
+    def search(self, query_embedding, k, partitions=None, nprobe=None):
+        """
+        Top-k по nprobe ближайшим кластерам
+
+        Args:
+            partitions (list): Искать только в этих разделах (None - по всей базе)
+            nprobe (int): Переопределение nprobe для одного запроса
+
+        Returns:
+            tuple: (индексы, оценки) по убыванию оценки
+        """
+        if not len(self) or not self.nlist:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = self.normalize_query(query_embedding)
+        codes = None
+        if partitions:
+            codes = [self.label_codes[label] for label in partitions
+                     if self.label_codes and label in self.label_codes]
+            if not codes:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        probe, _ = top_k_indices(self.centroids @ query, nprobe or self.nprobe)
+        # Кластер - непрерывный срез матрицы: умножаем срезы без копирования строк
+        spans = [(self.offsets[c], self.offsets[c + 1]) for c in probe]
+        positions = np.concatenate([np.arange(start, end) for start, end in spans])
+        scores = np.concatenate([self.matrix[start:end] @ query for start, end in spans])
+        if codes is not None:
+            mask = np.isin(self.row_codes[positions], codes)
+            # Раздел мог почти не попасть в просканированные кластеры - добираем перебором
+            if mask.sum() < k:
+                return self.exact_search(query_embedding, k, partitions)
+            positions, scores = positions[mask], scores[mask]
+
+        order, top_scores = top_k_indices(scores, k)
+        return self.rows[positions[order]], top_scores
+
+    def save(self, path):
+        """Сохранение кластеризации (сами векторы восстанавливаются из кэша эмбеддингов)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, order=self.rows, offsets=self.offsets,
+                 checksum=np.array(self.checksum))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, embeddings, labels=None, nprobe=ANN_NPROBE):
+        """
+        Загрузка кластеризации с диска
+
+        Returns:
+            IVFIndex или None, если файл не подходит к этой матрице
+        """
+        try:
+            with np.load(path) as data:
+                centroids, order, offsets = data["centroids"], data["order"], data["offsets"]
+                checksum = str(data["checksum"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or len(order) != len(matrix) or centroids.shape[1:] != matrix.shape[1:]:
+            return None
+        index = cls(matrix, labels=labels, nprobe=nprobe, centroids=centroids, order=order,
+                    offsets=offsets)
+        return index if index.checksum == checksum else None
+
+
+def build_vector_index(embeddings, labels=None, cache_path=None, min_vectors=ANN_MIN_VECTORS):
+    """
+    Векторный индекс для базы: точный для небольших баз, IVF - начиная с min_vectors строк
+
+    Args:
+        cache_path (str): Файл .npz для сохранения/загрузки кластеризации IVF
+    """
+    n = len(embeddings) if embeddings is not None else 0
+    if min_vectors <= 0 or n < min_vectors:
+        return VectorIndex(embeddings, labels=labels)
+
+    if cache_path and os.path.exists(cache_path):
+        index = IVFIndex.load(cache_path, embeddings, labels=labels)
+        if index is not None:
+            print(f"📂 IVF индекс загружен: {n} векторов, {index.nlist} кластеров")
+            return index
+
+    index = IVFIndex(embeddings, labels=labels, nlist=ANN_NLIST or None)
+    print(f"🧭 IVF индекс построен: {n} векторов, {index.nlist} кластеров, nprobe={index.nprobe}")
+    if cache_path:
+        try:
+            index.save(cache_path)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить IVF индекс: {e}")
+    return index
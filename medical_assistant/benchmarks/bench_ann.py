@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк приближенного поиска (IVF) против точного перебора
+Синтетические кластеризованные векторы (похожи на эмбеддинги текстов по темам):
+задержка запроса p50/p95 и recall@k относительно точного поиска
+
+    python benchmarks/bench_ann.py --sizes 10000 100000 1000000 --dim 128 --output ann.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann import IVFIndex  # noqa: E402
+from retrieval import VectorIndex  # noqa: E402
+
+GENERATE_BATCH_SIZE = 100000
+
+
+def synthetic_vectors(n, dim, topics, rng, noise=0.6):
+    """Векторы вокруг случайных «тем»: центр темы + шум"""
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, GENERATE_BATCH_SIZE):
+        size = min(GENERATE_BATCH_SIZE, n - start)
+        topic = rng.integers(0, topics, size)
+        vectors[start:start + size] = centers[topic] + \
+            noise * rng.standard_normal((size, dim)).astype(np.float32)
+    return vectors, centers
+
+
+def latency_stats(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+    }
+
+
+def timed_search(search, queries, k):
+    """Результаты и время каждого запроса"""
+    results, samples = [], []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = search(query, k)
+        samples.append(time.perf_counter() - start)
+        results.append(set(rows.tolist()))
+    return results, samples
+
+
+def run_size(n, args, rng):
+    vectors, centers = synthetic_vectors(n, args.dim, args.topics, rng)
+    topic = rng.integers(0, args.topics, args.queries)
+    queries = centers[topic] + 0.6 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    exact = VectorIndex(vectors)
+    truth, exact_samples = timed_search(exact.search, queries, args.k)
+    del exact
+
+    start = time.perf_counter()
+    ivf = IVFIndex(vectors, nlist=args.nlist or None)
+    build_seconds = time.perf_counter() - start
+    del vectors
+
+    result = {
+        "vectors": n,
+        "dim": args.dim,
+        "nlist": ivf.nlist,
+        "build_s": round(build_seconds, 2),
+        "exact": latency_stats(exact_samples),
+        "ivf": []
+    }
+
+    for nprobe in args.nprobe:
+        found, samples = timed_search(
+            lambda query, k: ivf.search(query, k, nprobe=nprobe), queries, args.k
+        )
+        recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+        result["ivf"].append({
+            "nprobe": nprobe,
+            f"recall@{args.k}": round(float(recall), 4),
+            **latency_stats(samples)
+        })
+
+    print(f"✅ {n} векторов: точный p50 {result['exact']['p50_ms']} мс, "
+          f"IVF построен за {result['build_s']}с ({ivf.nlist} кластеров)", file=sys.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IVF против точного поиска: задержка и полнота')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000],
+                        help='Размеры базы (число векторов)')
+    parser.add_argument('--dim', type=int, default=128,
+                        help='Размерность (nomic-embed-text: 768, но 1M x 768 ~ 3 ГБ)')
+    parser.add_argument('--queries', type=int, default=200, help='Запросов на размер')
+    parser.add_argument('--k', type=int, default=5, help='Сколько соседей искать')
+    parser.add_argument('--topics', type=int, default=1000, help='Число синтетических тем')
+    parser.add_argument('--nlist', type=int, default=0, help='Число кластеров (0 - ~sqrt(n))')
+    parser.add_argument('--nprobe', nargs='+', type=int, default=[4, 8, 16, 32],
+                        help='Значения nprobe для сравнения')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Файл для JSON результата')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = {
+        "benchmark": "ann",
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "results": [run_size(n, args, rng) for n in args.sizes]
+    }
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
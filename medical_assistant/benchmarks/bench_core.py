@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки функций конвейера core.py и server.py на фиксированных входных данных
+Истории болезни из папки «болезни», параграфы из data, синтетические базы эмбеддингов
+заданных размеров (без Ollama: эмбеддинг запроса заранее кладется в кэш запросов).
+Результат - JSON для сравнения до/после изменения:
+
+    python benchmarks/bench_core.py --output before.json
+    python benchmarks/bench_core.py --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.dirname(PACKAGE_DIR)
+
+sys.path.insert(0, PACKAGE_DIR)
+
+from cli import CASE_FILE_PATTERN  # noqa: E402
+from config import EMBEDDING_MODEL  # noqa: E402
+from core import MedicalAssistant  # noqa: E402
+from embeddings import QUERY_EMBEDDING_CACHE  # noqa: E402
+from server import MedicalAPIHandler  # noqa: E402
+
+CASES_DIR = os.path.join(PROJECT_DIR, "болезни")
+
+# Размерность nomic-embed-text
+EMBEDDING_DIM = 768
+
+DIAGNOSES = [
+    "Артериальная гипертензия", "Стабильная ИБС", "Мигрень без ауры", "Хронический вирусный гепатит С",
+    "Перелом лодыжки", "Вывих шейного позвонка", "Повреждение связок коленного сустава",
+    "Язвенный колит", "Диагноз не указан"
+]
+
+
+@contextlib.contextmanager
+def quiet():
+    """Функции core печатают ход работы - в замер вывод не попадает"""
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+class QuietHandler(MedicalAPIHandler):
+    """Обработчик без сокета: ответ пишется в память"""
+
+    def __init__(self):
+        self.request_version = 'HTTP/1.1'
+        self.requestline = 'POST /api/get_recommendations HTTP/1.1'
+        self.command = 'POST'
+        self.wfile = io.BytesIO()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def load_cases():
+    """Сырые истории болезни (JSON) и разобранные данные пациентов"""
+    assistant = MedicalAssistant()
+    raw_cases = []
+    for filepath in sorted(glob.glob(os.path.join(CASES_DIR, CASE_FILE_PATTERN))):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            raw_cases.append(json.load(f))
+    with quiet():
+        patients = [assistant.parse_patient_data_adaptive(raw) for raw in raw_cases]
+    return raw_cases, patients
+
+
+def synthetic_vault(assistant, size, rng):
+    """
+    База из size параграфов: реальные тексты по кругу, случайные нормированные эмбеддинги
+    Эмбеддинг поискового запроса - шум вокруг одного из параграфов (есть что найти)
+    """
+    with quiet():
+        paragraphs = assistant.load_treatment_paragraphs()
+    paragraphs = [paragraphs[row % len(paragraphs)] for row in range(size)]
+    embeddings = rng.standard_normal((size, EMBEDDING_DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    assistant.attach_vault(
+        [paragraph["text"] for paragraph in paragraphs], embeddings,
+        vault_sources=[{"disease": paragraph["disease"], "file": paragraph["file"]} for paragraph in paragraphs]
+    )
+    # Свой запрос на каждый размер: эмбеддинги запросов в кэше не перезаписывают друг друга
+    query = f"{assistant.default_treatment_query()} База: {size}."
+    target = embeddings[rng.integers(size)]
+    query_embedding = target + 0.3 * rng.standard_normal(EMBEDDING_DIM).astype(np.float32) / np.sqrt(EMBEDDING_DIM)
+    QUERY_EMBEDDING_CACHE.put((EMBEDDING_MODEL, assistant.build_search_query(query)), query_embedding.tolist())
+    return query
+
+
+def recommendation_payload(length=3000):
+    return {
+        "success": True,
+        "diagnosis": "Артериальная гипертензия",
+        "recommendation": ("Рекомендуется ИАПФ или БРА в сочетании с ББ, контроль АД. " * 60)[:length],
+        "processing_time": 21.4,
+        "model": "mistral:7b",
+        "rag_used": True,
+        "paragraphs_used": 116,
+        "cached": False
+    }
+
+
+def build_cases(args):
+    """Список (имя, параметры, функция без аргументов)"""
+    raw_cases, patients = load_cases()
+    assistant = MedicalAssistant()
+    handler = QuietHandler()
+
+    def send(payload):
+        handler.wfile.seek(0)
+        handler.wfile.truncate()
+        handler.send_json_response(200, payload)
+
+    cases = [
+        ("load_all_treatment_content", {}, assistant.load_all_treatment_content),
+        ("parse_patient_data_adaptive", {"cases": len(raw_cases)},
+         lambda: [assistant.parse_patient_data_adaptive(raw) for raw in raw_cases]),
+        ("flatten_data_structure", {"cases": len(raw_cases)},
+         lambda: [assistant.flatten_data_structure(raw) for raw in raw_cases]),
+        ("get_medical_specialization", {"diagnoses": len(DIAGNOSES)},
+         lambda: [assistant.get_medical_specialization(diagnosis) for diagnosis in DIAGNOSES]),
+        ("extract_diagnosis_from_data", {"cases": len(patients)},
+         lambda: [assistant.extract_diagnosis_from_data(patient) for patient in patients]),
+    ]
+
+    rng = np.random.default_rng(args.seed)
+    for size in args.vault_sizes:
+        searcher = MedicalAssistant()
+        searcher.patient_data = patients[0] if patients else {"Клинический диагноз": DIAGNOSES[0]}
+        query = synthetic_vault(searcher, size, rng)
+        # Индексы строятся при первом поиске - до замера
+        with quiet():
+            searcher.get_relevant_context(query, searcher.vault_embeddings_tensor, searcher.vault_content)
+        cases.append((
+            "get_relevant_context", {"vault_size": size},
+            lambda searcher=searcher, query=query: searcher.get_relevant_context(
+                query, searcher.vault_embeddings_tensor, searcher.vault_content
+            )
+        ))
+
+    batch = {"success": True, "results": [{"index": i, **recommendation_payload()} for i in range(50)]}
+    cases.append(("send_json_response", {"items": 1}, lambda: send(recommendation_payload())))
+    cases.append(("send_json_response", {"items": 50}, lambda: send(batch)))
+    return cases
+
+
+def measure(name, params, function, repeat, min_time):
+    """Время вызова: число повторов подбирается так, чтобы прогон длился не меньше min_time"""
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2
+    samples = [seconds / number for seconds in timer.repeat(repeat, number)]
+    return {
+        "name": name,
+        "params": params,
+        "number": number,
+        "repeat": repeat,
+        "median_us": round(statistics.median(samples) * 1e6, 2),
+        "min_us": round(min(samples) * 1e6, 2)
+    }
+
+
+def case_key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=PACKAGE_DIR).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    """Таблица «было/стало» по совпадающим случаям (stderr)"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {case_key(result): result for result in json.load(f)["results"]}
+    print(f"{'функция':<30} {'параметры':<20} {'было, мкс':>12} {'стало, мкс':>12} {'ускорение':>10}", file=sys.stderr)
+    for result in results:
+        before = baseline.get(case_key(result))
+        if before is None:
+            continue
+        params = ",".join(f"{key}={value}" for key, value in result["params"].items())
+        print(f"{result['name']:<30} {params:<20} {before['median_us']:>12} {result['median_us']:>12} "
+              f"{before['median_us'] / result['median_us']:>9.2f}x", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Микробенчмарки функций конвейера рекомендаций')
+    parser.add_argument('--vault-sizes', nargs='+', type=int, default=[100, 1000, 10000],
+                        help='Размеры синтетической базы для get_relevant_context')
+    parser.add_argument('--repeat', type=int, default=5, help='Прогонов на случай')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Минимальная длительность прогона (с)')
+    parser.add_argument('--only', nargs='+', help='Только эти функции')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', help='JSON прошлого запуска для сравнения')
+    parser.add_argument('--output', help='Файл для JSON результата')
+    args = parser.parse_args()
+
+    results = []
+    for name, params, function in build_cases(args):
+        if args.only and name not in args.only:
+            continue
+        with quiet():
+            result = measure(name, params, function, args.repeat, args.min_time)
+        print(f"✅ {name} {params}: {result['median_us']} мкс", file=sys.stderr)
+        results.append(result)
+
+    report = {
+        "benchmark": "core",
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "git_revision": git_revision(),
+        "results": results
+    }
+
+    if args.compare:
+        compare(results, args.compare)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
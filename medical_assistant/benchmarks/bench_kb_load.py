@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк загрузки базы знаний решателя: разбор JSON против бинарного снимка (kb_snapshot)
+Каждый замер - отдельный процесс (холодный запуск интерпретатора, файлы в кэше ОС)
+
+    python benchmarks/bench_kb_load.py --repeat 10 --output kb_load.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Способы загрузки: код, выполняемый в замере (path - путь к файлу базы)
+SCENARIOS = {
+    "json": "from kb_snapshot import read_json\nread_json(path)",
+    "solver_json": "from solver import ClinicalSolver\nClinicalSolver.from_file(path, use_snapshot=False)",
+    "solver_snapshot": "from solver import ClinicalSolver\nClinicalSolver.from_file(path, use_snapshot=True)",
+}
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {package_dir!r})
+import kb_snapshot, solver
+path = {path!r}
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed}}))
+"""
+
+
+def measure(path, scenario, repeat):
+    """Время загрузки в отдельных процессах (модули импортируются до замера)"""
+    samples = []
+    code = PROBE.format(package_dir=PACKAGE_DIR, path=path, code=SCENARIOS[scenario])
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=PACKAGE_DIR)
+        if result.returncode != 0:
+            return {"file": os.path.basename(path), "scenario": scenario,
+                    "error": result.stderr.strip().splitlines()[-1:]}
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1])["seconds"])
+
+    return {
+        "file": os.path.basename(path),
+        "scenario": scenario,
+        "repeat": repeat,
+        "median_ms": round(statistics.median(samples) * 1000, 2),
+        "min_ms": round(min(samples) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2)
+    }
+
+
+def main():
+    sys.path.insert(0, PACKAGE_DIR)
+    from config import KB_PATH
+    from solver import ClinicalSolver
+
+    parser = argparse.ArgumentParser(description='Загрузка баз знаний: JSON против снимка')
+    parser.add_argument('--repeat', type=int, default=10, help='Сколько запусков на сценарий')
+    parser.add_argument('--kb', default=KB_PATH, help='База знаний КлинРек')
+    parser.add_argument('--output', help='Файл для JSON результата')
+    args = parser.parse_args()
+
+    # Снимок собирается заранее: замеряется загрузка, а не первая сборка
+    ClinicalSolver.from_file(args.kb)
+
+    runs = [(args.kb, scenario) for scenario in SCENARIOS]
+    results = {
+        "benchmark": "kb_load",
+        "python": sys.version.split()[0],
+        "results": [measure(path, scenario, args.repeat) for path, scenario in runs]
+    }
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
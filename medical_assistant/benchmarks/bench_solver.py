@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк решателя: обратный индекс условий против полного перебора инструкций
+Синтетические пациенты по всем заболеваниям базы (случайная часть условий выполнена,
+часть нарушена) плюс истории болезни из папок проекта; результаты обоих способов сверяются
+
+    python benchmarks/bench_solver.py --patients 200 --output solver.json
+
+По умолчанию сверяется 213 пациентов (200 синтетических + 13 историй болезни);
+--patients 2000 - 2013 пациентов
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.dirname(PACKAGE_DIR)
+
+sys.path.insert(0, PACKAGE_DIR)
+
+from solver import ClinicalSolver, PatientFacts  # noqa: E402
+
+
+def condition_value(condition, rng, satisfy):
+    """Значение поля, выполняющее (или нарушающее) условие"""
+    if condition.kind == "present":
+        return "да"
+    if not satisfy:
+        return "нет данных" if rng.random() < 0.5 else str(rng.randint(-1000, -1))
+    if condition.values and (condition.kind == "any_of" or rng.random() < 0.5):
+        return rng.choice(sorted(condition.values))
+    low = condition.low if condition.low != float("-inf") else condition.high - 50
+    high = condition.high if condition.high != float("inf") else condition.low + 50
+    return f"{rng.uniform(low, high):.1f}"
+
+
+def synthetic_patients(solver, count, rng):
+    """Пациенты с диагнозом из базы и полями из условий ее инструкций"""
+    patients = []
+    for _ in range(count):
+        disease = rng.choice(solver.diseases)
+        conditions = [condition for record in solver.by_disease[disease] for condition in record.conditions]
+        patient = {"Клинический диагноз": disease}
+        for condition in rng.sample(conditions, min(len(conditions), rng.randint(1, 12))):
+            patient["_".join(condition.path)] = condition_value(condition, rng, rng.random() < 0.7)
+        patients.append((disease, patient))
+    return patients
+
+
+def case_patients():
+    """Истории болезни v.4 из папок проекта (диагноз определяет решатель)"""
+    from cli import CASE_FILE_PATTERN, parse_case_file
+
+    patients = []
+    for filepath in sorted(glob.glob(os.path.join(PROJECT_DIR, "болезни*", CASE_FILE_PATTERN))):
+        parsed = parse_case_file(filepath)
+        if "patient_data" in parsed:
+            patients.append((None, parsed["patient_data"]))
+    return patients
+
+
+def timed(function, patients, repeat):
+    """Среднее время подбора на пациента (мкс, без разбора данных) и результаты последнего прохода"""
+    samples = []
+    for _ in range(repeat):
+        # Новые PatientFacts на каждый проход: кэш поиска полей не переходит между способами
+        facts = [(disease, PatientFacts(patient)) for disease, patient in patients]
+        results = []
+        start = time.perf_counter()
+        for disease, patient_facts in facts:
+            results.append(function(disease, patient_facts))
+        samples.append((time.perf_counter() - start) / len(patients))
+    return round(statistics.median(samples) * 1e6, 2), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Решатель: обратный индекс против полного перебора')
+    parser.add_argument('--patients', type=int, default=200, help='Синтетических пациентов')
+    parser.add_argument('--repeat', type=int, default=5, help='Проходов на способ')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-cases', action='store_true', help='Без историй болезни из папок проекта')
+    parser.add_argument('--output', help='Файл для JSON результата')
+    args = parser.parse_args()
+
+    solver = ClinicalSolver.from_file()
+    patients = synthetic_patients(solver, args.patients, random.Random(args.seed))
+    if not args.no_cases:
+        patients += [
+            (solver.determine_disease(PatientFacts(patient).lookup(("диагноз",)) or []), patient)
+            for _, patient in case_patients()
+        ]
+    patients = [(disease, patient) for disease, patient in patients if disease]
+
+    exhaustive_us, expected = timed(
+        lambda disease, facts: solver.rank(solver.find_treatment_options(disease, facts)), patients, args.repeat
+    )
+    indexed_us, found = timed(solver.best_treatment_options, patients, args.repeat)
+    mismatches = sum(a != b for a, b in zip(expected, found))
+
+    results = {
+        "benchmark": "solver",
+        "python": sys.version.split()[0],
+        "diseases": len(solver.diseases),
+        "instructions": len(solver.records),
+        "conditions": sum(len(record.conditions) for record in solver.records),
+        "patients": len(patients),
+        "exhaustive_us": exhaustive_us,
+        "indexed_us": indexed_us,
+        "speedup": round(exhaustive_us / indexed_us, 2) if indexed_us else None,
+        "mismatches": mismatches
+    }
+    print(f"{'✅' if not mismatches else '❌'} Совпадение результатов: {len(patients) - mismatches}/{len(patients)}",
+          file=sys.stderr)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк времени запуска: импорт модулей medical_assistant в чистом интерпретаторе
+Каждый замер - отдельный процесс, чтобы не мешал кэш sys.modules
+
+    python benchmarks/bench_startup.py --repeat 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["config", "core", "vault", "server", "cli"]
+
+# Зависимости, которые не должны загружаться при импорте
+HEAVY_MODULES = ["torch", "ollama", "openai", "tkinter"]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {package_dir!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy_loaded": heavy}}))
+"""
+
+
+def measure(module, repeat):
+    """Время импорта модуля в отдельных процессах"""
+    samples = []
+    heavy_loaded = []
+
+    for _ in range(repeat):
+        code = PROBE.format(package_dir=PACKAGE_DIR, module=module, heavy=HEAVY_MODULES)
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True, text=True, cwd=PACKAGE_DIR
+        )
+        if result.returncode != 0:
+            return {"module": module, "error": result.stderr.strip().splitlines()[-1:]}
+
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(probe["seconds"])
+        heavy_loaded = probe["heavy_loaded"]
+
+    return {
+        "module": module,
+        "repeat": repeat,
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+        "heavy_loaded": heavy_loaded
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время импорта модулей medical_assistant')
+    parser.add_argument('--repeat', type=int, default=5, help='Сколько запусков на модуль')
+    parser.add_argument('--modules', nargs='+', default=MODULES, help='Модули для замера')
+    parser.add_argument('--output', help='Файл для JSON результата')
+    args = parser.parse_args()
+
+    results = {
+        "benchmark": "startup",
+        "python": sys.version.split()[0],
+        "results": [measure(module, args.repeat) for module in args.modules]
+    }
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
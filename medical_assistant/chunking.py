@@ -0,0 +1,67 @@
+"""
+Нарезка параграфов на перекрывающиеся фрагменты под контекст модели эмбеддингов
+Каждый фрагмент помнит номер родительского параграфа
+"""
+from config import CHARS_PER_TOKEN, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+
+
+def estimate_tokens(text):
+    """Грубая оценка числа токенов по длине текста"""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Делит текст на окна по границам слов
+
+    Args:
+        text (str): Текст параграфа
+        max_tokens (int): Размер окна в токенах
+        overlap_tokens (int): Перекрытие соседних окон в токенах
+
+    Returns:
+        list: Фрагменты текста (короткий текст - один фрагмент)
+    """
+    max_chars = max(1, int(max_tokens * CHARS_PER_TOKEN))
+    overlap_chars = max(0, min(int(overlap_tokens * CHARS_PER_TOKEN), max_chars // 2))
+
+    words = text.split()
+    if len(text) <= max_chars or len(words) <= 1:
+        return [text]
+
+    chunks = []
+    start = 0
+    while start < len(words):
+        end = start
+        length = 0
+        while end < len(words) and (end == start or length + 1 + len(words[end]) <= max_chars):
+            length += len(words[end]) + (1 if end > start else 0)
+            end += 1
+
+        chunks.append(" ".join(words[start:end]))
+        if end >= len(words):
+            break
+
+        # Следующее окно начинается так, чтобы захватить overlap_chars конца текущего
+        next_start = end
+        overlap = 0
+        while next_start > start + 1 and overlap + len(words[next_start - 1]) + 1 <= overlap_chars:
+            next_start -= 1
+            overlap += len(words[next_start]) + 1
+        start = next_start
+
+    return chunks
+
+
+def chunk_paragraphs(paragraphs, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Фрагменты для списка параграфов
+
+    Returns:
+        list: Словари {"text", "parent"}, parent - номер параграфа в paragraphs
+    """
+    chunks = []
+    for parent, paragraph in enumerate(paragraphs):
+        for text in chunk_text(paragraph, max_tokens, overlap_tokens):
+            chunks.append({"text": text, "parent": parent})
+    return chunks
@@ -4,11 +4,19 @@ import sys
 import os
 import shutil
 import glob
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
 # Добавьте путь к текущей директории в Python path
 sys.path.insert(0, os.path.dirname(__file__))
 
+from config import BATCH_CONCURRENCY
 from core import MedicalAssistant
+from vault import TreatmentVault
+
+# Шаблон файлов историй болезни для пакетного режима
+CASE_FILE_PATTERN = 'история_болезни_*.json'
 
 
 def copy_json_to_data_dir(json_filepath, data_dir='ИБ'):
@@ -33,6 +41,179 @@ def copy_json_to_data_dir(json_filepath, data_dir='ИБ'):
     return destination
 
 
+def parse_case_file(filepath):
+    """
+    Чтение и разбор одной истории болезни (выполняется в рабочем процессе)
+
+    Returns:
+        dict: {"file", "patient_data"} или {"file", "error"}
+    """
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            raw_data = json.load(f)
+        patient_data = MedicalAssistant().parse_patient_data_adaptive(raw_data)
+        if not patient_data:
+            return {"file": filepath, "error": "Не удалось извлечь данные пациента"}
+        return {"file": filepath, "patient_data": patient_data}
+    except Exception as e:
+        return {"file": filepath, "error": str(e)}
+
+
+def find_case_files(path):
+    """Файлы историй болезни: папка (по шаблону CASE_FILE_PATTERN) или glob-шаблон"""
+    if os.path.isdir(path):
+        files = glob.glob(os.path.join(path, CASE_FILE_PATTERN))
+    else:
+        files = glob.glob(path)
+    return sorted(os.path.abspath(f) for f in files if os.path.isfile(f))
+
+
+def load_finished_files(output_path):
+    """
+    Файлы, уже успешно обработанные в прошлых запусках (для продолжения)
+    Оборванная последняя строка после сбоя пропускается
+    """
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                finished.add(record.get("file"))
+    return finished
+
+
+def terminate_partial_line(output_path):
+    """Завершает оборванную при сбое строку, чтобы новая запись не склеилась с ней"""
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return
+    with open(output_path, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def recommend_for_case(case, vault, model):
+    """Рекомендация для одной разобранной истории болезни на общей базе"""
+    start_time = time.time()
+    record = {"file": case["file"], "model": model}
+
+    if "error" in case:
+        return {**record, "status": "error", "error": case["error"], "processing_time": 0.0}
+
+    try:
+        assistant = MedicalAssistant(model=model)
+        assistant.patient_data = case["patient_data"]
+        vault.attach(assistant)
+        recommendation = assistant.get_treatment_recommendation()
+        failed = recommendation.startswith("❌")
+        record.update({
+            "status": "error" if failed else "ok",
+            "diagnosis": assistant.extract_diagnosis_from_data(assistant.patient_data),
+            "recommendation": recommendation
+        })
+    except Exception as e:
+        record.update({"status": "error", "error": str(e)})
+
+    record["processing_time"] = round(time.time() - start_time, 2)
+    return record
+
+
+def run_bulk(path, output_path, model, workers=None, concurrency=BATCH_CONCURRENCY, resume=True):
+    """
+    Пакетная обработка историй болезни без GUI и без папки ИБ
+
+    Файлы разбираются в пуле процессов, рекомендации строятся на одной общей базе
+    параграфов, результаты дописываются в JSONL по мере готовности.
+    При повторном запуске уже успешно обработанные файлы пропускаются.
+
+    Returns:
+        tuple: (успешно, с ошибкой)
+    """
+    files = find_case_files(path)
+    if not files:
+        print(f"[ОШИБКА] Не найдено файлов историй болезни: {path}")
+        return 0, 0
+
+    finished = load_finished_files(output_path) if resume else set()
+    pending = [f for f in files if f not in finished]
+    print(f"[ПАКЕТ] Найдено {len(files)} файлов, уже обработано {len(files) - len(pending)}, "
+          f"осталось {len(pending)}")
+    if not pending:
+        return 0, 0
+
+    # База строится один раз, пока рабочие процессы разбирают файлы
+    vault = TreatmentVault()
+    vault.build_in_background()
+
+    succeeded = failed = 0
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    if resume:
+        terminate_partial_line(output_path)
+
+    with ProcessPoolExecutor(max_workers=workers) as parsers, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as generators, \
+            open(output_path, 'a' if resume else 'w', encoding='utf-8') as output:
+        # Разбор запускается до ожидания базы: файлы разбираются, пока строятся эмбеддинги
+        parsing = {parsers.submit(parse_case_file, filepath): filepath for filepath in pending}
+        try:
+            vault.get()
+        except RuntimeError as e:
+            # Без базы рекомендаций не будет: все файлы - с ошибкой (повторятся при следующем запуске)
+            print(f"[ОШИБКА] {e}")
+            for future in parsing:
+                future.cancel()
+            for filepath in pending:
+                record = {"file": filepath, "model": model, "status": "error", "error": str(e),
+                          "processing_time": 0.0}
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            os.fsync(output.fileno())
+            print(f"[ПАКЕТ] Готово: 0 успешно, {len(pending)} с ошибкой -> {output_path}")
+            return 0, len(pending)
+
+        # Генерация начинается, как только разобран очередной файл,
+        # запись - как только готова очередная рекомендация
+        generating = set()
+        position = 0
+        while parsing or generating:
+            done, _ = wait(set(parsing) | generating, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in parsing:
+                    filepath = parsing.pop(future)
+                    try:
+                        case = future.result()
+                    except Exception as e:
+                        # Рабочий процесс упал - запись об ошибке, остальные файлы продолжаются
+                        case = {"file": filepath, "error": f"Ошибка разбора: {e}"}
+                    generating.add(generators.submit(recommend_for_case, case, vault, model))
+                    continue
+
+                generating.discard(future)
+                record = future.result()
+                # Запись сразу на диск: после сбоя продолжаем с этого места
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                os.fsync(output.fileno())
+
+                position += 1
+                if record["status"] == "ok":
+                    succeeded += 1
+                else:
+                    failed += 1
+                print(f"[ПАКЕТ] {position}/{len(pending)} {os.path.basename(record['file'])}: "
+                      f"{record['status']} за {record['processing_time']}с")
+
+    print(f"[ПАКЕТ] Готово: {succeeded} успешно, {failed} с ошибкой -> {output_path}")
+    return succeeded, failed
+
+
 def main():
     parser = argparse.ArgumentParser(description='Медицинский ассистент для рекомендаций по лечению')
     parser.add_argument('--model', default='mistral', help='Модель Ollama для использования')
@@ -40,9 +221,22 @@ def main():
     parser.add_argument('--json-file', help='Путь к JSON файлу пациента (будет скопирован в папку данных)')
     parser.add_argument('--diagnosis', help='Прямое указание диагноза для тестирования')
     parser.add_argument('--interactive', action='store_true', help='Интерактивный режим')
+    parser.add_argument('--bulk', help='Папка или glob-шаблон историй болезни для пакетной обработки')
+    parser.add_argument('--output', default='bulk_results.jsonl', help='JSONL файл результатов пакета')
+    parser.add_argument('--workers', type=int, help='Процессов для разбора файлов (по умолчанию - число CPU)')
+    parser.add_argument('--concurrency', type=int, default=BATCH_CONCURRENCY,
+                        help='Параллельных запросов к модели в пакете')
+    parser.add_argument('--no-resume', action='store_true', help='Обработать все файлы заново')
 
     args = parser.parse_args()
 
+    if args.bulk:
+        succeeded, failed = run_bulk(
+            args.bulk, args.output, args.model, args.workers, args.concurrency,
+            resume=not args.no_resume
+        )
+        sys.exit(1 if failed and not succeeded else 0)
+
     try:
         # Если указан JSON файл, копируем его в папку данных
         if args.json_file:
@@ -56,8 +250,15 @@ def main():
         print("[ИНИЦИАЛИЗАЦИЯ] Медицинского ассистента...")
         assistant = MedicalAssistant(model=args.model)
         
-        # Если указан диагноз для тестирования, создаем тестовые данные
-        if args.diagnosis:
+        # Данные пациента: из указанного файла, тестовый диагноз или диалог выбора файла
+        if args.json_file and not args.diagnosis:
+            case = parse_case_file(args.json_file)
+            if "error" in case:
+                print(f"[ОШИБКА] {case['error']}")
+                sys.exit(1)
+            assistant.patient_data = case["patient_data"]
+        elif args.diagnosis:
+            # Если указан диагноз для тестирования, создаем тестовые данные
             print(f"[ТЕСТ] Используем тестовый диагноз: {args.diagnosis}")
             assistant.patient_data = {
                 "Клинический диагноз": {
@@ -70,7 +271,8 @@ def main():
                 }
             }
         else:
-            assistant.initialize_system(data_path=args.data_dir)
+            # Только данные пациента: эмбеддинги параграфов - в общей базе ниже, без повторной генерации
+            assistant.patient_data = assistant.load_patient_data_smart(args.data_dir)
 
         if not assistant.patient_data:
             print("[ОШИБКА] Не удалось загрузить данные пациента")
@@ -78,14 +280,10 @@ def main():
 
         print("[АНАЛИЗ] Получение рекомендации по лечению...")
 
-        # Используем прямое обращение к ollama_chat вместо get_treatment_recommendation
-        system_message = assistant.get_system_message_by_diagnosis(assistant.patient_data)
-        clinical_diagnosis = assistant.patient_data.get("Клинический диагноз", {}).get("Значение", "не указан")
-        
-        # Если есть данные пациента, загружаем соответствующие параграфы
-        if not args.diagnosis:
-            assistant.vault_content = assistant.load_relevant_paragraphs(assistant.patient_data)
-            assistant.vault_embeddings_tensor = assistant.generate_embeddings(assistant.vault_content)
+        # Общая база параграфов (поиск по разделу диагноза)
+        TreatmentVault().get().attach(assistant)
+        system_message = assistant.get_intelligent_system_message(assistant.patient_data)
+        clinical_diagnosis = assistant.extract_diagnosis_from_data(assistant.patient_data)
         
         user_input = f"Назначьте лечение для пациента с диагнозом: {clinical_diagnosis}"
 
@@ -94,7 +292,6 @@ def main():
             system_message,
             assistant.vault_embeddings_tensor,
             assistant.vault_content,
-            assistant.model,
             assistant.conversation_history,
             assistant.patient_data
         )
@@ -108,7 +305,6 @@ def main():
         if args.interactive:
             print("\n[ИНТЕРАКТИВ] Вход в интерактивный режим...")
             # Создаем простой интерактивный цикл
-            system_message = assistant.get_system_message_by_diagnosis(assistant.patient_data)
             print("\n[ИНТЕРАКТИВ] Режим (введите 'exit' для выхода)")
 
             while True:
@@ -126,7 +322,6 @@ def main():
                         system_message,
                         assistant.vault_embeddings_tensor,
                         assistant.vault_content,
-                        assistant.model,
                         assistant.conversation_history,
                         assistant.patient_data
                     )
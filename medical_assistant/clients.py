@@ -0,0 +1,112 @@
+"""
+Общие на процесс HTTP клиенты Ollama с пулом соединений и keep-alive
+- чат: OpenAI-совместимый клиент (/v1/chat/completions)
+- эмбеддинги: ollama.Client (/api/embed, /api/embeddings)
+Клиенты создаются при первом обращении (openai, ollama и httpx - тяжелые импорты)
+"""
+import threading
+
+from config import (
+    CHAT_TIMEOUT, EMBED_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY, HTTP_POOL_SIZE, OLLAMA_HOST
+)
+
+_lock = threading.Lock()
+_chat_client = None
+_ollama_client = None
+
+
+class ConnectionStats:
+    """
+    Счетчики переиспользования соединений
+    Новое соединение видно по событию connect_tcp трассировки httpcore;
+    запрос без такого события ушел по уже открытому соединению
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def on_request(self, request):
+        """Хук httpx: считает запрос и подключает трассировку соединения"""
+        with self._lock:
+            self.requests += 1
+        parent_trace = request.extensions.get("trace")
+
+        def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                with self._lock:
+                    self.new_connections += 1
+            if parent_trace is not None:
+                parent_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+
+    def stats(self):
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused": reused,
+                "reuse_rate": round(reused / self.requests, 3) if self.requests else 0.0
+            }
+
+
+CHAT_CONNECTIONS = ConnectionStats()
+OLLAMA_CONNECTIONS = ConnectionStats()
+
+
+def _http_options(read_timeout, stats):
+    """Параметры httpx.Client: пул, keep-alive, таймауты и счетчик соединений"""
+    import httpx
+
+    return {
+        "limits": httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        "timeout": httpx.Timeout(read_timeout, connect=HTTP_CONNECT_TIMEOUT),
+        "event_hooks": {"request": [stats.on_request]}
+    }
+
+
+def get_chat_client():
+    """OpenAI-совместимый клиент Ollama, один на процесс"""
+    global _chat_client
+    if _chat_client is None:
+        with _lock:
+            if _chat_client is None:
+                import httpx
+                from openai import OpenAI
+
+                _chat_client = OpenAI(
+                    base_url=f"{OLLAMA_HOST}/v1",
+                    api_key='llama3',  # можно оставить любой
+                    http_client=httpx.Client(**_http_options(CHAT_TIMEOUT, CHAT_CONNECTIONS))
+                )
+    return _chat_client
+
+
+def get_ollama_client():
+    """Клиент нативного API Ollama (эмбеддинги), один на процесс"""
+    global _ollama_client
+    if _ollama_client is None:
+        with _lock:
+            if _ollama_client is None:
+                import ollama
+
+                _ollama_client = ollama.Client(
+                    host=OLLAMA_HOST, **_http_options(EMBED_TIMEOUT, OLLAMA_CONNECTIONS)
+                )
+    return _ollama_client
+
+
+def connection_stats():
+    """Статистика соединений для /api/health"""
+    return {
+        "chat": CHAT_CONNECTIONS.stats(),
+        "ollama": OLLAMA_CONNECTIONS.stats()
+    }
@@ -0,0 +1,100 @@
+"""
+Настройки медицинского ассистента
+Любое значение можно переопределить переменной окружения MEDASSIST_*
+"""
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Папка с параграфами лечения
+DATA_DIR = os.environ.get("MEDASSIST_DATA_DIR", os.path.join(BASE_DIR, "data"))
+
+# Папка для служебных кэшей (эмбеддинги и т.п.)
+CACHE_DIR = os.environ.get("MEDASSIST_CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+
+# Модель эмбеддингов Ollama
+EMBEDDING_MODEL = os.environ.get("MEDASSIST_EMBEDDING_MODEL", "nomic-embed-text")
+
+# Постоянный кэш эмбеддингов параграфов
+EMBEDDING_CACHE_PATH = os.environ.get(
+    "MEDASSIST_EMBEDDING_CACHE",
+    os.path.join(CACHE_DIR, "embeddings.sqlite3")
+)
+
+# Повторный эмбеддинг фрагментов, не получивших эмбеддинг при построении базы
+# (Ollama была недоступна): не чаще раза в столько секунд при обращении к базе
+VAULT_REPAIR_INTERVAL = float(os.environ.get("MEDASSIST_VAULT_REPAIR_INTERVAL", "30"))
+
+# Параллельная обработка запросов сервером
+SERVER_WORKERS = int(os.environ.get("MEDASSIST_WORKERS", "2"))
+SERVER_QUEUE_SIZE = int(os.environ.get("MEDASSIST_QUEUE_SIZE", "8"))
+SERVER_RETRY_AFTER = int(os.environ.get("MEDASSIST_RETRY_AFTER", "30"))
+
+# Пакетная генерация эмбеддингов
+EMBED_BATCH_SIZE = int(os.environ.get("MEDASSIST_EMBED_BATCH_SIZE", "32"))
+EMBED_WORKERS = int(os.environ.get("MEDASSIST_EMBED_WORKERS", "4"))
+
+# Кэш эмбеддингов запросов (в памяти)
+QUERY_CACHE_SIZE = int(os.environ.get("MEDASSIST_QUERY_CACHE_SIZE", "512"))
+QUERY_CACHE_TTL = float(os.environ.get("MEDASSIST_QUERY_CACHE_TTL", "3600"))
+
+# Кэш готовых рекомендаций
+RESULT_CACHE_SIZE = int(os.environ.get("MEDASSIST_RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.environ.get("MEDASSIST_RESULT_CACHE_TTL", "86400"))
+# Папка дискового уровня кэша; пустое значение - только память
+RESULT_CACHE_DIR = os.environ.get("MEDASSIST_RESULT_CACHE_DIR", "")
+
+# Нарезка параграфов на фрагменты для эмбеддингов
+# Оценка: ~2.5 символа кириллицы на токен модели эмбеддингов
+CHARS_PER_TOKEN = float(os.environ.get("MEDASSIST_CHARS_PER_TOKEN", "2.5"))
+CHUNK_TOKENS = int(os.environ.get("MEDASSIST_CHUNK_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("MEDASSIST_CHUNK_OVERLAP_TOKENS", "64"))
+# Параграф длиннее этого в промпт не подставляется целиком - только найденный фрагмент
+CONTEXT_MAX_CHARS = int(os.environ.get("MEDASSIST_CONTEXT_MAX_CHARS", "3000"))
+
+# Приближенный поиск (IVF) для больших баз; меньше ANN_MIN_VECTORS строк - точный перебор
+# 0 отключает IVF полностью
+ANN_MIN_VECTORS = int(os.environ.get("MEDASSIST_ANN_MIN_VECTORS", "20000"))
+# Число кластеров (0 - ~sqrt(n)) и число сканируемых кластеров на запрос
+ANN_NLIST = int(os.environ.get("MEDASSIST_ANN_NLIST", "0"))
+ANN_NPROBE = int(os.environ.get("MEDASSIST_ANN_NPROBE", "16"))
+
+# Пакетные рекомендации: максимум записей в одном запросе и параллельных генераций внутри пакета
+BATCH_MAX_ITEMS = int(os.environ.get("MEDASSIST_BATCH_MAX_ITEMS", "200"))
+BATCH_CONCURRENCY = int(os.environ.get("MEDASSIST_BATCH_CONCURRENCY", "2"))
+
+# Адрес Ollama (как переменная OLLAMA_HOST у самой Ollama)
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+OLLAMA_HOST = os.environ.get("MEDASSIST_OLLAMA_HOST", os.environ.get("OLLAMA_HOST", DEFAULT_OLLAMA_HOST))
+if "://" not in OLLAMA_HOST:
+    OLLAMA_HOST = f"http://{OLLAMA_HOST}"
+OLLAMA_HOST = OLLAMA_HOST.rstrip("/")
+
+# Фоновая проверка Ollama для /api/health и /api/models: интервал и таймаут (секунды)
+HEALTH_PROBE_INTERVAL = float(os.environ.get("MEDASSIST_HEALTH_PROBE_INTERVAL", "10"))
+HEALTH_PROBE_TIMEOUT = float(os.environ.get("MEDASSIST_HEALTH_PROBE_TIMEOUT", "3"))
+
+# Общие HTTP клиенты Ollama: размер пула соединений и таймауты (секунды)
+HTTP_POOL_SIZE = int(os.environ.get("MEDASSIST_HTTP_POOL_SIZE", "16"))
+HTTP_KEEPALIVE_CONNECTIONS = int(os.environ.get("MEDASSIST_HTTP_KEEPALIVE", "8"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("MEDASSIST_HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("MEDASSIST_HTTP_CONNECT_TIMEOUT", "5"))
+CHAT_TIMEOUT = float(os.environ.get("MEDASSIST_CHAT_TIMEOUT", "300"))
+EMBED_TIMEOUT = float(os.environ.get("MEDASSIST_EMBED_TIMEOUT", "60"))
+
+# Переписывание уточняющих вопросов перед поиском контекста:
+#   llm - отдельный запрос к модели (медленно), heuristic - шаблон из прошлого вопроса,
+#   speculative - поиск по шаблону параллельно с llm, берется лучший результат, off - без переписывания
+REWRITE_STRATEGY = os.environ.get("MEDASSIST_REWRITE_STRATEGY", "heuristic")
+# Сколько speculative режим ждет ответа llm (секунды), потом остается с шаблонным поиском
+REWRITE_TIMEOUT = float(os.environ.get("MEDASSIST_REWRITE_TIMEOUT", "2.0"))
+
+# База знаний клинических рекомендаций для решателя (/api/solve)
+KB_PATH = os.environ.get("MEDASSIST_KB_PATH", os.path.join(os.path.dirname(BASE_DIR), "КлинРек II ур.simple.json"))
+# Бинарные снимки баз знаний вместо разбора JSON при каждом запуске (0 - всегда читать JSON)
+KB_SNAPSHOT = os.environ.get("MEDASSIST_KB_SNAPSHOT", "1") != "0"
+# Каталог снимков (по умолчанию - рядом с исходным файлом)
+KB_SNAPSHOT_DIR = os.environ.get("MEDASSIST_KB_SNAPSHOT_DIR", "")
+
+# Папка для файлов cProfile запросов с ?profile=1 (пусто - только разбивка по этапам в ответе)
+PROFILE_DIR = os.environ.get("MEDASSIST_PROFILE_DIR", "")
@@ -1,13 +1,29 @@
-import torch
-import ollama
 import os
 import json
 import re
 import glob
-from openai import OpenAI
-import tkinter as tk
-from tkinter import filedialog
+import time
+import numpy as np
 import shutil
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from ann import build_vector_index
+from chunking import chunk_paragraphs
+from clients import get_chat_client
+from config import CONTEXT_MAX_CHARS, DATA_DIR, EMBEDDING_MODEL, REWRITE_STRATEGY, REWRITE_TIMEOUT
+from embedding_cache import get_embedding_cache
+from embeddings import embed_texts, embed_query
+from lexical import LexicalIndex, reciprocal_rank_fusion, tokenize
+from metrics import observe, timed
+from profiling import current_profile
+from partitions import disease_from_filename, match_partitions
+
+# Версия шаблонов промптов: увеличивать при любом изменении текста промптов,
+# чтобы кэш рекомендаций не отдавал ответы, полученные по старому шаблону
+PROMPT_TEMPLATE_VERSION = 1
+
+# Стратегии переписывания уточняющих вопросов (см. REWRITE_STRATEGY в config.py)
+REWRITE_STRATEGIES = ("llm", "heuristic", "speculative", "off")
 
 
 class MedicalAssistant:
@@ -19,14 +35,23 @@ class MedicalAssistant:
             model (str): Название модели Ollama
         """
         self.model = model
-        self.client = OpenAI(
-            base_url='http://localhost:11434/v1',
-            api_key='llama3'  # можно оставить любой
-        )
+        self._client = None
         self.conversation_history = []
         self.patient_data = {}
         self.vault_content = []
         self.vault_embeddings_tensor = None
+        self.vault_sources = []
+        self.vault_chunks = []
+        self.vault_index = None
+        self._vault_index_source = None
+        self.lexical_index = None
+        self._lexical_index_source = None
+        # Строки последней матрицы эмбеддингов, заполненные нулями из-за ошибки Ollama
+        self.failed_embedding_rows = []
+        # Где реально искался контекст: разделы и поиск по всей базе (для версии в кэше ответов)
+        self.searched_partitions = set()
+        self.searched_everywhere = False
+        self.rewrite_strategy = REWRITE_STRATEGY
         
         # Цвета для консоли
         self.PINK = '\033[95m'
@@ -35,6 +60,20 @@ class MedicalAssistant:
         self.NEON_GREEN = '\033[92m'
         self.RESET_COLOR = '\033[0m'
     
+    @property
+    def client(self):
+        """
+        OpenAI-совместимый клиент Ollama
+        Общий на процесс (пул соединений с keep-alive), создается при первом обращении
+        """
+        if self._client is None:
+            self._client = get_chat_client()
+        return self._client
+    
+    @client.setter
+    def client(self, value):
+        self._client = value
+    
     def open_file(self, filepath):
         """Чтение файла"""
         with open(filepath, 'r', encoding='utf-8') as f:
@@ -193,6 +232,10 @@ class MedicalAssistant:
     
     def open_file_dialog(self):
         """Диалог выбора файла"""
+        # tkinter нужен только здесь: импортируем по требованию
+        import tkinter as tk
+        from tkinter import filedialog
+        
         root = tk.Tk()
         root.withdraw()
         root.attributes('-topmost', True)
@@ -257,8 +300,7 @@ class MedicalAssistant:
         """
         Получает ВСЕ доступные файлы с лечением
         """
-        base_dir = os.path.dirname(__file__)
-        data_dir = os.path.join(base_dir, "data")
+        data_dir = DATA_DIR
         
         if not os.path.exists(data_dir):
             print(f"⚠️  Папка {data_dir} не найдена!")
@@ -275,13 +317,15 @@ class MedicalAssistant:
         print(f"📚 Найдено {len(treatment_files)} файлов с лечением")
         return treatment_files
     
-    def load_all_treatment_content(self):
+    def load_treatment_paragraphs(self):
         """
         Загружает ВСЕ доступные параграфы лечения из папки data
-        ИСПРАВЛЕНО: лучший парсинг параграфов
+        вместе с источником: каждый параграф помнит заболевание и файл
+        
+        Returns:
+            list: Словари {"text", "disease", "file"} без дубликатов текста
         """
-        base_dir = os.path.dirname(__file__)
-        data_dir = os.path.join(base_dir, "data")
+        data_dir = DATA_DIR
         
         if not os.path.exists(data_dir):
             print(f"⚠️ Папка {data_dir} не найдена!")
@@ -290,16 +334,20 @@ class MedicalAssistant:
         
         # Ищем ВСЕ txt файлы
         treatment_files = []
-        for filename in os.listdir(data_dir):
+        for filename in sorted(os.listdir(data_dir)):
             if filename.endswith('.txt'):
                 filepath = os.path.join(data_dir, filename)
                 treatment_files.append(filepath)
         
         print(f"📚 Найдено {len(treatment_files)} файлов с лечением")
         
-        all_content = []
+        all_paragraphs = []
         
         for filepath in treatment_files:
+            filename = os.path.basename(filepath)
+            disease = disease_from_filename(filepath)
+            file_paragraphs = []
+            
             try:
                 with open(filepath, 'r', encoding='utf-8') as f:
                     content = f.read()
@@ -318,26 +366,47 @@ class MedicalAssistant:
                            (len(line) > 2 and line[0].isdigit() and line[1] == '.'):
                             # Сохраняем предыдущий параграф
                             if current_paragraph:
-                                all_content.append(' '.join(current_paragraph))
+                                file_paragraphs.append(' '.join(current_paragraph))
                                 current_paragraph = []
                         
                         current_paragraph.append(line)
                     
                     # Добавляем последний параграф
                     if current_paragraph:
-                        all_content.append(' '.join(current_paragraph))
+                        file_paragraphs.append(' '.join(current_paragraph))
                     
-                    file_paragraphs = len([p for p in all_content if p])
-                    print(f"📖 Загружено из {os.path.basename(filepath)}: {file_paragraphs} параграфов")
+                    print(f"📖 Загружено из {filename}: {len(file_paragraphs)} параграфов")
                     
             except Exception as e:
                 print(f"⚠️ Ошибка загрузки {filepath}: {e}")
+            
+            all_paragraphs.extend(
+                {"text": text, "disease": disease, "file": filename}
+                for text in file_paragraphs
+            )
         
-        # Убираем дубликаты
-        all_content = list(dict.fromkeys(all_content))
+        # Убираем дубликаты (источником остается первый файл)
+        unique = {}
+        for paragraph in all_paragraphs:
+            unique.setdefault(paragraph["text"], paragraph)
+        all_paragraphs = list(unique.values())
         
-        print(f"📚 ВСЕГО загружено: {len(all_content)} уникальных параграфов лечения")
-        return all_content
+        print(f"📚 ВСЕГО загружено: {len(all_paragraphs)} уникальных параграфов лечения")
+        return all_paragraphs
+    
+    def set_vault_paragraphs(self, paragraphs):
+        """Тексты параграфов в vault_content, их источники в vault_sources"""
+        self.vault_content = [paragraph["text"] for paragraph in paragraphs]
+        self.vault_sources = [
+            {"disease": paragraph["disease"], "file": paragraph["file"]}
+            for paragraph in paragraphs
+        ]
+    
+    def load_all_treatment_content(self):
+        """
+        Загружает ВСЕ доступные параграфы лечения из папки data (только тексты)
+        """
+        return [paragraph["text"] for paragraph in self.load_treatment_paragraphs()]
     
     def extract_diagnosis_from_data(self, patient_data):
         """
@@ -426,20 +495,99 @@ class MedicalAssistant:
         
         return system_message
     
-    def get_relevant_context(self, query, vault_embeddings, vault_content, top_k=5):
+    def attach_vault(self, vault_content, vault_embeddings, vault_index=None, vault_sources=None,
+                     vault_chunks=None, lexical_index=None):
+        """
+        Подключение готовой базы параграфов (и уже построенного индекса)
+        
+        Args:
+            vault_chunks (list): Фрагменты {"text", "parent"}, если эмбеддинги построены
+                по фрагментам; по умолчанию строка эмбеддингов = параграф
+        """
+        self.vault_content = vault_content
+        self.vault_embeddings_tensor = vault_embeddings
+        self.vault_sources = vault_sources or []
+        self.vault_chunks = vault_chunks or []
+        self.vault_index = vault_index
+        self._vault_index_source = vault_embeddings if vault_index is not None else None
+        self.lexical_index = lexical_index
+        self._lexical_index_source = vault_content if lexical_index is not None else None
+    
+    def get_vault_index(self, vault_embeddings):
+        """
+        Векторный индекс для матрицы эмбеддингов
+        Строится один раз на матрицу и переиспользуется между запросами
+        """
+        if self.vault_index is None or self._vault_index_source is not vault_embeddings:
+            labels = [source["disease"] for source in self.vault_sources] or None
+            if labels and self.vault_chunks:
+                labels = [labels[chunk["parent"]] for chunk in self.vault_chunks]
+            self.vault_index = build_vector_index(vault_embeddings, labels=labels)
+            self._vault_index_source = vault_embeddings
+        return self.vault_index
+    
+    def get_lexical_index(self, vault_content):
+        """
+        Лексический индекс BM25 по тем же строкам, что и векторный
+        (по фрагментам, если они есть, иначе по параграфам)
+        """
+        if self.lexical_index is None or self._lexical_index_source is not vault_content:
+            documents = [chunk["text"] for chunk in self.vault_chunks] or vault_content
+            self.lexical_index = LexicalIndex(documents)
+            self._lexical_index_source = vault_content
+        return self.lexical_index
+    
+    def rows_to_paragraph_hits(self, rows, scores):
+        """
+        Строки индекса (фрагменты) -> родительские параграфы
+        Для каждого параграфа остается лучший фрагмент
+        
+        Returns:
+            list: (номер параграфа, оценка, строка индекса) по убыванию оценки
+        """
+        hits = []
+        seen = set()
+        for row, score in zip(rows, scores):
+            paragraph_idx = self.vault_chunks[row]["parent"] if self.vault_chunks else row
+            if paragraph_idx not in seen:
+                seen.add(paragraph_idx)
+                hits.append((paragraph_idx, score, row))
+        return hits
+    
+    def get_paragraph_context(self, paragraph_idx, row, vault_content):
+        """
+        Текст для промпта: родительский параграф целиком,
+        а слишком длинный параграф - только найденный фрагмент
+        """
+        content = vault_content[paragraph_idx].strip()
+        if self.vault_chunks and len(content) > CONTEXT_MAX_CHARS:
+            return self.vault_chunks[row]["text"].strip()
+        return content
+    
+    def build_search_query(self, query, diagnosis=None):
+        """Текст для эмбеддинга: запрос + диагноз + ключевые слова лечения"""
+        if diagnosis is None:
+            diagnosis = self.extract_diagnosis_from_data(self.patient_data)
+        return f"{query} {diagnosis} лечение рекомендации дозировки"
+    
+    def get_relevant_context(self, query, vault_embeddings, vault_content, top_k=5, partitions=None,
+                             with_scores=False):
         """
         Поиск релевантного контекста с УЛУЧШЕННОЙ точностью
+        
+        Args:
+            partitions (list): Разделы (заболевания) для поиска; по умолчанию
+                определяются по диагнозу, иначе поиск по всей базе. Если в разделах
+                ничего не прошло порог, поиск повторяется по всей базе
+            with_scores (bool): Вернуть пары (контекст, оценка) вместо контекстов
         """
+        requested_top_k = top_k
         # ИСПРАВЛЕНО: явная проверка на None и размер
         if vault_embeddings is None:
             print("⚠️ Эмбеддинги не загружены (None)")
             return []
         
-        if not isinstance(vault_embeddings, torch.Tensor):
-            print("⚠️ Эмбеддинги не являются тензором")
-            return []
-        
-        if vault_embeddings.nelement() == 0:
+        if len(vault_embeddings) == 0:
             print("⚠️ Эмбеддинги пустые")
             return []
         
@@ -450,52 +598,84 @@ class MedicalAssistant:
         print(f"🔍 Поиск контекста для: {query[:100]}...")
         
         try:
+            index = self.get_vault_index(vault_embeddings)
+            
             # Извлекаем диагноз для лучшего поиска
             diagnosis = self.extract_diagnosis_from_data(self.patient_data)
             
             # Расширяем запрос ключевыми словами
-            enhanced_query = f"{query} {diagnosis} лечение рекомендации дозировки"
+            enhanced_query = self.build_search_query(query, diagnosis)
             
-            # Генерируем эмбеддинг
-            input_embedding = ollama.embeddings(
-                model='nomic-embed-text', 
-                prompt=enhanced_query
-            )["embedding"]
+            # Генерируем эмбеддинг (повторные запросы - из кэша)
+            with timed("embedding"):
+                input_embedding = embed_query(enhanced_query, model=EMBEDDING_MODEL)
             
-            input_embedding_tensor = torch.tensor(input_embedding).unsqueeze(0)
+            with timed("search"):
+                # Ищем только в разделе заболевания, если диагноз к нему относится
+                if partitions is None:
+                    partitions = match_partitions(diagnosis, index.partitions.keys())
+                    if not partitions:
+                        print("🌐 Раздел по диагнозу не найден, поиск по всей базе")
+                if partitions:
+                    print(f"🗂️  Поиск в разделах: {', '.join(partitions)}")
+                    self.searched_partitions.update(partitions)
+                else:
+                    self.searched_everywhere = True
             
-            # Нормализация
-            vault_normalized = torch.nn.functional.normalize(vault_embeddings, p=2, dim=1)
-            input_normalized = torch.nn.functional.normalize(input_embedding_tensor, p=2, dim=1)
+                # ПОНИЖАЕМ ПОРОГ для лучшего покрытия
+                top_k = min(top_k * 2, len(vault_content))
+                # По фрагментам берем с запасом: у одного параграфа их может быть несколько
+                row_k = min(top_k * 4, len(index)) if self.vault_chunks else top_k
+                vector_rows, _ = index.search(input_embedding, row_k, partitions=partitions)
             
-            # Косинусное сходство
-            cos_scores = torch.cosine_similarity(input_normalized, vault_normalized)
+                # Лексический поиск BM25 по тем же разделам: формы слов, препараты, дозировки
+                lexical_index = self.get_lexical_index(vault_content)
+                lexical_hits = lexical_index.search(
+                    enhanced_query, row_k, rows=index.partition_rows(partitions)
+                )
+                lexical_rows = [row for row, _ in lexical_hits]
             
-            # ПОНИЖАЕМ ПОРОГ для лучшего покрытия
-            top_k = min(top_k * 2, len(vault_content))
-            top_indices = torch.topk(cos_scores, k=top_k)[1].tolist()
+                # Слияние рангов (RRF); косинус по-прежнему нужен для порога
+                fused_rows = [row for row, _ in reciprocal_rank_fusion([vector_rows.tolist(), lexical_rows])]
+                fused_scores = index.row_scores(input_embedding, fused_rows).tolist() if fused_rows else []
+                top_hits = self.rows_to_paragraph_hits(fused_rows, fused_scores)[:top_k]
             
-            similarity_threshold = 0.65
-            relevant_context = []
+                similarity_threshold = 0.65
+                relevant_context = []
+                context_scores = []
+                # Лучшие лексические совпадения проходят и с низким косинусом
+                lexical_top = set(lexical_rows[:3])
+                diagnosis_terms = set(tokenize(diagnosis)[:3])
             
-            for idx in top_indices:
-                if cos_scores[idx] >= similarity_threshold:
-                    content = vault_content[idx].strip()
-                    # Проверяем, что контент релевантен диагнозу
-                    if diagnosis.lower() in content.lower() or \
-                       any(word in content.lower() for word in diagnosis.lower().split()[:3]):
+                for idx, score, row in top_hits:
+                    if score >= similarity_threshold or row in lexical_top:
+                        content = self.get_paragraph_context(idx, row, vault_content)
+                        # Проверяем, что контент релевантен диагнозу (по основам слов)
+                        if lexical_index.contains_any(row, diagnosis_terms):
+                            relevant_context.append(content)
+                            context_scores.append(score)
+                            print(f"   ✅ Релевантность {score:.3f}: {content[:80]}...")
+            
+                # Раздел определен неверно или в нем нет подходящего - ищем по всей базе
+                search_everywhere = not relevant_context and bool(partitions)
+                
+                # Если ничего не нашли, берем топ-3 даже с низкой релевантностью
+                if not relevant_context and top_hits and not search_everywhere:
+                    print("⚠️ Ничего с высоким score, беру топ-3")
+                    for idx, score, row in top_hits[:3]:
+                        content = self.get_paragraph_context(idx, row, vault_content)
                         relevant_context.append(content)
-                        print(f"   ✅ Релевантность {cos_scores[idx]:.3f}: {content[:80]}...")
+                        context_scores.append(score)
+                        print(f"   ⚠️ Score {score:.3f}: {content[:80]}...")
             
-            # Если ничего не нашли, берем топ-3 даже с низкой релевантностью
-            if not relevant_context and top_indices:
-                print("⚠️ Ничего с высоким score, беру топ-3")
-                for idx in top_indices[:3]:
-                    content = vault_content[idx].strip()
-                    relevant_context.append(content)
-                    print(f"   ⚠️ Score {cos_scores[idx]:.3f}: {content[:80]}...")
+            if search_everywhere:
+                print("🌐 В разделах ничего выше порога, поиск по всей базе")
+                return self.get_relevant_context(query, vault_embeddings, vault_content, requested_top_k,
+                                                 partitions=[], with_scores=with_scores)
             
             print(f"✅ Найдено {len(relevant_context)} релевантных контекстов")
+            if with_scores:
+                return list(zip(relevant_context, context_scores))[:3]
             return relevant_context[:3]
             
         except Exception as e:
@@ -540,24 +720,119 @@ class MedicalAssistant:
             print(f"⚠️ Ошибка переписывания запроса: {e}")
             return user_input
     
-    def ollama_chat(self, user_input, system_message, vault_embeddings, vault_content, 
-                   conversation_history, patient_data):
+    def previous_user_query(self, conversation_history):
+        """Исходный текст прошлого вопроса (в истории он заменен промптом с контекстом)"""
+        for message in reversed(conversation_history[:-1]):
+            if message.get("role") == "user":
+                return message.get("query", message.get("content", ""))
+        return ""
+    
+    def heuristic_rewrite_query(self, user_input, conversation_history, patient_data):
         """
-        Основная функция общения с моделью
+        Переписывание без обращения к модели: уточняющий вопрос + прошлый вопрос
+        (диагноз добавляет build_search_query)
+        """
+        previous_query = self.previous_user_query(conversation_history)
+        if not previous_query or previous_query == user_input:
+            return user_input
+        return f"{user_input} {previous_query}"
+    
+    def retrieve_with_rewrite(self, user_input, vault_embeddings, vault_content,
+                              conversation_history, patient_data):
+        """
+        Поиск контекста для уточняющего вопроса по стратегии self.rewrite_strategy
+        
+        Returns:
+            list: Релевантные контексты
         """
-        conversation_history.append({"role": "user", "content": user_input})
+        strategy = self.rewrite_strategy
+        if strategy not in REWRITE_STRATEGIES:
+            print(f"⚠️ Неизвестная стратегия переписывания '{strategy}', используем heuristic")
+            strategy = "heuristic"
+        
+        if strategy == "speculative":
+            return self.speculative_retrieval(
+                user_input, vault_embeddings, vault_content, conversation_history, patient_data
+            )
+        
+        start_time = time.time()
+        with timed("rewrite"):
+            if strategy == "llm":
+                query = self.rewrite_query(user_input, conversation_history, patient_data)
+            elif strategy == "heuristic":
+                query = self.heuristic_rewrite_query(user_input, conversation_history, patient_data)
+            else:
+                query = user_input
+        rewrite_time = time.time() - start_time
+        
+        relevant_context = self.get_relevant_context(query, vault_embeddings, vault_content)
+        print(f"⏱️ Переписывание ({strategy}): {rewrite_time:.3f}с, "
+              f"поиск: {time.time() - start_time - rewrite_time:.3f}с")
+        return relevant_context
+    
+    def speculative_retrieval(self, user_input, vault_embeddings, vault_content,
+                              conversation_history, patient_data):
+        """
+        Поиск по шаблонному запросу, пока модель переписывает запрос в фоне
+        Если переписанный запрос готов за REWRITE_TIMEOUT - ищем и по нему и берем
+        результат с лучшей оценкой; иначе остается шаблонный
+        """
+        start_time = time.time()
+        pool = ThreadPoolExecutor(max_workers=1)
+        future = pool.submit(self.rewrite_query, user_input, conversation_history, patient_data)
+        pool.shutdown(wait=False)
+        
+        draft_query = self.heuristic_rewrite_query(user_input, conversation_history, patient_data)
+        draft = self.get_relevant_context(draft_query, vault_embeddings, vault_content, with_scores=True)
+        draft_time = time.time() - start_time
+        
+        try:
+            rewritten_query = future.result(timeout=max(0.0, REWRITE_TIMEOUT - draft_time))
+        except TimeoutError:
+            rewritten_query = None
+        rewrite_wait = time.time() - start_time - draft_time
+        # Ожидание переписанного запроса сверх шаблонного поиска
+        observe("rewrite", rewrite_wait)
+        
+        best, source = draft, "heuristic"
+        if rewritten_query and rewritten_query not in (user_input, draft_query):
+            rewritten = self.get_relevant_context(
+                rewritten_query, vault_embeddings, vault_content, with_scores=True
+            )
+            # Лучше тот, у кого выше лучшая оценка; при равенстве - шаблонный (уже готов)
+            if rewritten and (not draft or rewritten[0][1] > draft[0][1]):
+                best, source = rewritten, "llm"
+        
+        print(f"⏱️ Переписывание (speculative): шаблонный поиск {draft_time:.3f}с, "
+              f"ожидание llm {rewrite_wait:.3f}с{'' if rewritten_query else ' (не дождались)'}, "
+              f"всего {time.time() - start_time:.3f}с, выбран {source}")
+        return [content for content, _ in best]
+    
+    def prepare_chat_messages(self, user_input, system_message, vault_embeddings, vault_content,
+                              conversation_history, patient_data):
+        """
+        Подготовка сообщений для модели: переписывание запроса, поиск контекста, промпт
+        
+        Returns:
+            tuple: (messages, relevant_context)
+        """
+        # query - исходный вопрос: content ниже заменяется промптом с контекстом
+        conversation_history.append({"role": "user", "content": user_input, "query": user_input})
         
         if len(conversation_history) > 1:
-            rewritten_query = self.rewrite_query(user_input, conversation_history, patient_data)
+            relevant_context = self.retrieve_with_rewrite(
+                user_input, vault_embeddings, vault_content, conversation_history, patient_data
+            )
         else:
-            rewritten_query = user_input
-        
-        relevant_context = self.get_relevant_context(
-            rewritten_query, 
-            vault_embeddings, 
-            vault_content
-        )
+            relevant_context = self.get_relevant_context(user_input, vault_embeddings, vault_content)
         
+        with timed("prompt"):
+            messages = self.build_chat_messages(user_input, system_message, relevant_context,
+                                                conversation_history)
+        return messages, relevant_context
+    
+    def build_chat_messages(self, user_input, system_message, relevant_context, conversation_history):
+        """Промпт с найденным контекстом и сообщения для модели (последние 3 из истории)"""
         if relevant_context:
             context_str = "\n\n".join(relevant_context)
             full_prompt = f"""КОНТЕКСТ ЛЕЧЕНИЯ:
@@ -575,20 +850,38 @@ class MedicalAssistant:
         
         messages = [
             {"role": "system", "content": system_message},
-            *conversation_history[-3:]
+            *({"role": message["role"], "content": message["content"]}
+              for message in conversation_history[-3:])
         ]
         
+        return messages
+    
+    def ollama_chat(self, user_input, system_message, vault_embeddings, vault_content, 
+                   conversation_history, patient_data):
+        """
+        Основная функция общения с моделью
+        """
+        messages, _ = self.prepare_chat_messages(
+            user_input, system_message, vault_embeddings, vault_content,
+            conversation_history, patient_data
+        )
+        
         try:
             print("🧠 Запрос к модели...")
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=2000,
-                temperature=0.3,
-                timeout=60
-            )
+            if current_profile() is not None:
+                # Профилируемый запрос идет потоком: иначе не узнать время до первого токена
+                answer = "".join(self.stream_completion(messages))
+            else:
+                with timed("completion"):
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=2000,
+                        temperature=0.3,
+                        timeout=60
+                    )
+                answer = response.choices[0].message.content
             
-            answer = response.choices[0].message.content
             conversation_history.append({"role": "assistant", "content": answer})
             
             print(f"✅ Получен ответ ({len(answer)} символов)")
@@ -599,37 +892,132 @@ class MedicalAssistant:
             print(error_msg)
             return error_msg
     
+    def stream_completion(self, messages):
+        """
+        Потоковый запрос к модели: фрагменты ответа по мере генерации
+        Время до первого фрагмента и полное время - в метрики (first_token, completion)
+        """
+        start_time = time.time()
+        first_token = True
+        with timed("completion"):
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=2000,
+                temperature=0.3,
+                timeout=60,
+                stream=True
+            )
+            
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token:
+                        observe("first_token", time.time() - start_time)
+                        first_token = False
+                    yield delta
+    
+    def ollama_chat_stream(self, user_input, system_message, vault_embeddings, vault_content,
+                           conversation_history, patient_data):
+        """
+        Потоковая версия ollama_chat
+        Выдает события (тип, данные): сначала "context", затем "token" по мере генерации,
+        в конце "done" или "error"
+        """
+        messages, relevant_context = self.prepare_chat_messages(
+            user_input, system_message, vault_embeddings, vault_content,
+            conversation_history, patient_data
+        )
+        
+        yield "context", {
+            "contexts_found": len(relevant_context),
+            "contexts": [content[:300] for content in relevant_context]
+        }
+        
+        start_time = time.time()
+        first_token_time = None
+        parts = []
+        
+        try:
+            print("🧠 Потоковый запрос к модели...")
+            for delta in self.stream_completion(messages):
+                if first_token_time is None:
+                    first_token_time = time.time() - start_time
+                parts.append(delta)
+                yield "token", {"text": delta}
+            
+        except Exception as e:
+            print(f"❌ Ошибка получения ответа: {e}")
+            yield "error", {"error": str(e)}
+            return
+        
+        answer = "".join(parts)
+        conversation_history.append({"role": "assistant", "content": answer})
+        
+        print(f"✅ Получен ответ ({len(answer)} символов)")
+        yield "done", {
+            "length": len(answer),
+            "first_token_time": round(first_token_time, 2) if first_token_time is not None else None,
+            "generation_time": round(time.time() - start_time, 2)
+        }
+    
     def generate_embeddings(self, content_list):
         """
         Генерация эмбеддингов для списка контента
+        Уже посчитанные эмбеддинги берутся из постоянного кэша
+        Неудачные элементы заполняются нулями, их номера - в self.failed_embedding_rows
         """
         print(f"🔧 Генерация эмбеддингов для {len(content_list)} элементов...")
         
-        embeddings = []
+        texts = list(content_list)
+        cache = get_embedding_cache()
+        embeddings = cache.get_many(EMBEDDING_MODEL, texts)
         
-        for i, content in enumerate(content_list):
-            try:
-                if i % 50 == 0:
-                    print(f"   Прогресс: {i}/{len(content_list)}")
-                
-                response = ollama.embeddings(
-                    model='nomic-embed-text',
-                    prompt=content[:1000]
-                )
-                embeddings.append(response["embedding"])
-                
-            except Exception as e:
-                print(f"⚠️ Ошибка эмбеддинга для элемента {i}: {e}")
-                embeddings.append([0] * 768)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        print(f"💾 Кэш эмбеддингов: {len(texts) - len(missing)} попаданий, {len(missing)} промахов")
+        
+        new_items = []
+        self.failed_embedding_rows = []
+        
+        if missing:
+            vectors = embed_texts([texts[i] for i in missing], model=EMBEDDING_MODEL)
+            for i, vector in zip(missing, vectors):
+                if vector is None:
+                    print(f"⚠️ Ошибка эмбеддинга для элемента {i}")
+                    embeddings[i] = [0] * 768
+                    self.failed_embedding_rows.append(i)
+                else:
+                    embeddings[i] = vector
+                    new_items.append((texts[i], vector))
+        
+        if new_items:
+            cache.put_many(EMBEDDING_MODEL, new_items)
+        if self.failed_embedding_rows:
+            print(f"⚠️ Без эмбеддинга осталось {len(self.failed_embedding_rows)} из {len(texts)} элементов")
         
         if not embeddings:
             print("⚠️ Не удалось создать эмбеддинги")
-            return torch.tensor([])
+            return np.zeros((0, 768), dtype=np.float32)
         
-        embeddings_tensor = torch.tensor(embeddings)
-        print(f"✅ Создан тензор эмбеддингов: {embeddings_tensor.shape}")
+        embeddings_matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        print(f"✅ Создана матрица эмбеддингов: {embeddings_matrix.shape}")
         
-        return embeddings_tensor
+        return embeddings_matrix
+    
+    def embed_paragraphs(self, paragraphs):
+        """
+        Эмбеддинги параграфов с нарезкой на перекрывающиеся фрагменты,
+        чтобы индекс покрывал длинные параграфы целиком
+        
+        Returns:
+            tuple: (матрица эмбеддингов фрагментов, фрагменты {"text", "parent"})
+        """
+        chunks = chunk_paragraphs(paragraphs)
+        print(f"✂️  {len(paragraphs)} параграфов -> {len(chunks)} фрагментов")
+        embeddings = self.generate_embeddings([chunk["text"] for chunk in chunks])
+        return embeddings, chunks
     
     def initialize_system(self, data_path='ИБ'):
         """
@@ -652,7 +1040,7 @@ class MedicalAssistant:
         print(f"📌 Диагноз: {diagnosis}")
         
         print("\n[2/3] 📚 Загрузка базы знаний лечения...")
-        self.vault_content = self.load_all_treatment_content()
+        self.set_vault_paragraphs(self.load_treatment_paragraphs())
         
         if not self.vault_content:
             print("⚠️ Нет данных лечения. Создаем минимальную базу...")
@@ -664,7 +1052,8 @@ class MedicalAssistant:
             ]
         
         print("\n[3/3] 🔧 Генерация эмбеддингов...")
-        self.vault_embeddings_tensor = self.generate_embeddings(self.vault_content)
+        self.vault_embeddings_tensor, self.vault_chunks = self.embed_paragraphs(self.vault_content)
+        self.vault_index = None
         
         print("\n" + "=" * 60)
         print("✅ СИСТЕМА ГОТОВА К РАБОТЕ")
@@ -672,43 +1061,61 @@ class MedicalAssistant:
         
         return True
     
-    def get_treatment_recommendation(self, custom_query=None):
-        """
-        Получает рекомендации по лечению через RAG
-        ИСПРАВЛЕНО: гарантированная загрузка контекста
+    def default_treatment_query(self, diagnosis=None):
+        """Стандартный запрос на назначение лечения по диагнозу и возрасту"""
+        if diagnosis is None:
+            diagnosis = self.extract_diagnosis_from_data(self.patient_data)
+        
+        age = "не указан"
+        if 'Возраст' in self.patient_data:
+            age_val = self.patient_data['Возраст']
+            if isinstance(age_val, dict) and 'Значение' in age_val:
+                age = age_val['Значение']
+            else:
+                age = age_val
+        
+        return f"Назначь лечение для пациента с диагнозом: {diagnosis}. Возраст: {age} лет."
+    
+    def prepare_recommendation_request(self, custom_query=None):
         """
-        if not self.patient_data:
-            print("❌ Данные пациента не загружены")
-            return self.get_fallback_recommendation("Данные пациента не загружены")
+        Подготовка запроса рекомендаций: база параграфов, запрос, системное сообщение
         
+        Returns:
+            tuple: (user_query, system_message)
+        """
         diagnosis = self.extract_diagnosis_from_data(self.patient_data)
         
         if not self.vault_content:
             print("📚 Контент не загружен, загружаем...")
-            self.vault_content = self.load_all_treatment_content()
-            
-            if self.vault_content:
-                print("🔧 Генерируем эмбеддинги...")
-                self.vault_embeddings_tensor = self.generate_embeddings(self.vault_content)
+            with timed("vault"):
+                self.set_vault_paragraphs(self.load_treatment_paragraphs())
+                
+                if self.vault_content:
+                    print("🔧 Генерируем эмбеддинги...")
+                    self.vault_embeddings_tensor, self.vault_chunks = self.embed_paragraphs(self.vault_content)
+                    self.vault_index = None
         
-        if custom_query:
-            user_query = custom_query
-        else:
-            age = "не указан"
-            if 'Возраст' in self.patient_data:
-                age_val = self.patient_data['Возраст']
-                if isinstance(age_val, dict) and 'Значение' in age_val:
-                    age = age_val['Значение']
-                else:
-                    age = age_val
-            
-            user_query = f"Назначь лечение для пациента с диагнозом: {diagnosis}. Возраст: {age} лет."
+        user_query = custom_query or self.default_treatment_query(diagnosis)
         
-        system_message = self.get_intelligent_system_message(self.patient_data)
+        with timed("prompt"):
+            system_message = self.get_intelligent_system_message(self.patient_data)
         
         print(f"\n🤖 ЗАПРОС К RAG: {user_query}")
         print(f"📚 Параграфов в базе: {len(self.vault_content) if self.vault_content else 0}")
         
+        return user_query, system_message
+    
+    def get_treatment_recommendation(self, custom_query=None):
+        """
+        Получает рекомендации по лечению через RAG
+        ИСПРАВЛЕНО: гарантированная загрузка контекста
+        """
+        if not self.patient_data:
+            print("❌ Данные пациента не загружены")
+            return self.get_fallback_recommendation("Данные пациента не загружены")
+        
+        user_query, system_message = self.prepare_recommendation_request(custom_query)
+        
         recommendation = self.ollama_chat(
             user_input=user_query,
             system_message=system_message,
@@ -720,6 +1127,27 @@ class MedicalAssistant:
         
         return recommendation
     
+    def get_treatment_recommendation_stream(self, custom_query=None):
+        """
+        Потоковая версия get_treatment_recommendation
+        Выдает те же события, что и ollama_chat_stream
+        """
+        if not self.patient_data:
+            print("❌ Данные пациента не загружены")
+            yield "error", {"error": "Данные пациента не загружены"}
+            return
+        
+        user_query, system_message = self.prepare_recommendation_request(custom_query)
+        
+        yield from self.ollama_chat_stream(
+            user_input=user_query,
+            system_message=system_message,
+            vault_embeddings=self.vault_embeddings_tensor,
+            vault_content=self.vault_content,
+            conversation_history=self.conversation_history,
+            patient_data=self.patient_data
+        )
+    
     def get_fallback_recommendation(self, reason="Контекст лечения не найден"):
         """
         Резервные рекомендации, когда RAG не сработал
@@ -0,0 +1,141 @@
+"""
+Постоянный кэш эмбеддингов параграфов
+Ключ: (адрес Ollama, модель эмбеддингов, SHA-256 текста параграфа)
+Хранится в SQLite, переживает перезапуски сервера. Адрес в ключе не дает векторам
+другого сервера (например, fake_ollama.py при нагрузочном тесте) попасть в поиск
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+
+from config import DEFAULT_OLLAMA_HOST, EMBEDDING_CACHE_PATH, OLLAMA_HOST
+
+# Версия схемы (PRAGMA user_version): 0 - таблица embeddings без адреса Ollama
+SCHEMA_VERSION = 1
+
+
+def content_hash(text):
+    """SHA-256 текста, по которому строится эмбеддинг"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path=EMBEDDING_CACHE_PATH, host=OLLAMA_HOST):
+        """
+        Кэш эмбеддингов на диске
+
+        Args:
+            path (str): Путь к файлу базы SQLite
+            host (str): Адрес Ollama, которая считает эмбеддинги (часть ключа)
+        """
+        self.path = path
+        self.host = host
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS host_embeddings (
+                   host TEXT NOT NULL,
+                   model TEXT NOT NULL,
+                   content_hash TEXT NOT NULL,
+                   vector BLOB NOT NULL,
+                   PRIMARY KEY (host, model, content_hash)
+               )"""
+        )
+        self._conn.commit()
+        self._migrate()
+
+    def _migrate(self):
+        """
+        Однократный перенос кэша прежнего формата (без адреса Ollama)
+        Прежние векторы считались Ollama по адресу по умолчанию - под ним они и сохраняются
+        """
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+
+        with self._conn:
+            legacy = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'embeddings'"
+            ).fetchone()
+            if legacy:
+                moved = self._conn.execute(
+                    "INSERT OR IGNORE INTO host_embeddings (host, model, content_hash, vector) "
+                    "SELECT ?, model, content_hash, vector FROM embeddings",
+                    (DEFAULT_OLLAMA_HOST,)
+                ).rowcount
+                self._conn.execute("DROP TABLE embeddings")
+                print(f"💾 Кэш эмбеддингов перенесен в новый формат: {moved} записей ({DEFAULT_OLLAMA_HOST})")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def get_many(self, model, texts):
+        """
+        Возвращает список эмбеддингов в порядке texts
+        Для отсутствующих в кэше элементов - None
+        """
+        hashes = [content_hash(text) for text in texts]
+        found = {}
+
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            # SQLite ограничивает число параметров запроса
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT content_hash, vector FROM host_embeddings "
+                    f"WHERE host = ? AND model = ? AND content_hash IN ({placeholders})",
+                    [self.host, model, *chunk]
+                ).fetchall()
+                for row_hash, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[row_hash] = vector.tolist()
+
+        return [found.get(h) for h in hashes]
+
+    def put_many(self, model, items):
+        """
+        Сохраняет эмбеддинги
+
+        Args:
+            model (str): Модель эмбеддингов
+            items (list): Пары (текст, эмбеддинг)
+        """
+        rows = [
+            (self.host, model, content_hash(text), array('f', embedding).tobytes())
+            for text, embedding in items
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO host_embeddings (host, model, content_hash, vector) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM host_embeddings WHERE host = ?", (self.host,)
+            ).fetchone()[0]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Общий для процесса экземпляр кэша"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
@@ -0,0 +1,104 @@
+"""
+Пакетная и параллельная генерация эмбеддингов через Ollama
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from caching import LRUCache
+from clients import get_ollama_client
+from config import (
+    EMBEDDING_MODEL, EMBED_BATCH_SIZE, EMBED_WORKERS,
+    QUERY_CACHE_SIZE, QUERY_CACHE_TTL
+)
+
+# Эмбеддинги поисковых запросов: GUI часто повторяет одни и те же диагнозы
+QUERY_EMBEDDING_CACHE = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+
+def _embed_batch(model, batch):
+    """
+    Один запрос /api/embed на весь пакет
+    При ошибке пакета - поэлементно, неудачные элементы -> None
+    """
+    client = get_ollama_client()
+
+    try:
+        vectors = client.embed(model=model, input=batch)["embeddings"]
+        if len(vectors) == len(batch):
+            return vectors
+        print(f"⚠️ Ollama вернула {len(vectors)} эмбеддингов вместо {len(batch)}")
+    except Exception as e:
+        print(f"⚠️ Ошибка пакетного эмбеддинга ({len(batch)} элементов): {e}")
+
+    vectors = []
+    for text in batch:
+        try:
+            vectors.append(client.embeddings(model=model, prompt=text)["embedding"])
+        except Exception as e:
+            print(f"⚠️ Ошибка эмбеддинга: {e}")
+            vectors.append(None)
+    return vectors
+
+
+def embed_texts(texts, model=EMBEDDING_MODEL, batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS):
+    """
+    Эмбеддинги для списка текстов
+
+    Args:
+        texts (list): Тексты
+        model (str): Модель эмбеддингов
+        batch_size (int): Сколько текстов в одном запросе
+        workers (int): Сколько запросов выполняется параллельно
+
+    Returns:
+        list: Эмбеддинги в порядке texts (None для неудачных)
+    """
+    if not texts:
+        return []
+
+    batch_size = max(1, batch_size)
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+
+    embeddings = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+        # map сохраняет порядок пакетов
+        for vectors in pool.map(lambda batch: _embed_batch(model, batch), batches):
+            embeddings.extend(vectors)
+            print(f"   Прогресс: {len(embeddings)}/{len(texts)}")
+
+    return embeddings
+
+
+def embed_query(text, model=EMBEDDING_MODEL):
+    """
+    Эмбеддинг поискового запроса
+    Повторный запрос с тем же текстом берется из QUERY_EMBEDDING_CACHE
+    """
+    key = (model, text)
+    embedding = QUERY_EMBEDDING_CACHE.get(key)
+    if embedding is not None:
+        return embedding
+
+    embedding = get_ollama_client().embeddings(model=model, prompt=text)["embedding"]
+    QUERY_EMBEDDING_CACHE.put(key, embedding)
+    return embedding
+
+
+def embed_queries(texts, model=EMBEDDING_MODEL):
+    """
+    Эмбеддинги нескольких поисковых запросов: промахи кэша - одним пакетом
+    Результаты сохраняются в QUERY_EMBEDDING_CACHE, последующие embed_query их находят
+
+    Returns:
+        list: Эмбеддинги в порядке texts (None для неудачных)
+    """
+    embeddings = [QUERY_EMBEDDING_CACHE.get((model, text)) for text in texts]
+    missing = list(dict.fromkeys(text for text, emb in zip(texts, embeddings) if emb is None))
+    if not missing:
+        return embeddings
+
+    computed = dict(zip(missing, embed_texts(missing, model=model)))
+    for text, embedding in computed.items():
+        if embedding is not None:
+            QUERY_EMBEDDING_CACHE.put((model, text), embedding)
+
+    return [emb if emb is not None else computed.get(text) for text, emb in zip(texts, embeddings)]
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Ollama для нагрузочного тестирования и бенчмарков без моделей
+Реализует то, что использует проект:
+- /api/embed, /api/embeddings - детерминированные эмбеддинги (хэширование слов, 768 измерений)
+- /api/tags, /api/version - список моделей для /api/health и /api/models
+- /v1/chat/completions - заготовленный ответ, обычный и потоковый (SSE)
+Задержка ответа, время до первого токена и скорость генерации настраиваются
+
+    python fake_ollama.py --port 11435 --latency 0.05 --first-token 0.5 --tokens-per-second 30
+    export MEDASSIST_OLLAMA_HOST=http://127.0.0.1:11435
+    python server.py
+    python cli.py --bulk "../болезни" --output fake.jsonl
+
+Кэш эмбеддингов и кэш рекомендаций хранят адрес Ollama в ключе: тестовые векторы
+и ответы не попадают в выдачу при работе с настоящей Ollama
+"""
+import argparse
+import hashlib
+import http.server
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+import uuid
+
+import numpy as np
+
+DEFAULT_PORT = 11435
+DEFAULT_DIM = 768
+DEFAULT_MODELS = ["mistral:7b", "mistral:latest", "nomic-embed-text:latest"]
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+TOKEN_PATTERN = re.compile(r"\S+\s*")
+DIAGNOSIS_PATTERN = re.compile(r"ОСНОВНОЙ ДИАГНОЗ:\s*(.+)")
+
+CANNED_COMPLETION = """1. Краткое резюме случая
+Пациент с диагнозом «{diagnosis}». Данные пациента и контекст лечения учтены.
+
+2. Основные направления лечения
+Лечение согласно клиническим рекомендациям из предоставленного контекста.
+
+3. Конкретные рекомендации
+Препараты, дозировки и сроки - по найденным параграфам клинических рекомендаций.
+
+4. Наблюдение и контроль
+Контрольный осмотр через 2-4 недели, оценка переносимости терапии.
+
+5. Рекомендации для пациента
+Соблюдать режим приема препаратов, при ухудшении состояния обратиться к врачу.
+
+(Ответ сгенерирован тестовым сервером fake_ollama.py)"""
+
+
+def hashed_embedding(text, dim=DEFAULT_DIM):
+    """
+    Детерминированный эмбеддинг: слова хэшируются в измерения со знаком (feature hashing)
+    Тексты с общими словами получают близкие векторы - поиск по базе работает осмысленно
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in WORD_PATTERN.findall(str(text).lower()):
+        digest = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+        vector[digest % dim] += 1.0 if (digest >> 32) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+class FakeOllamaSettings:
+    def __init__(self, latency=0.0, embed_latency=0.0, first_token=0.0, tokens_per_second=0.0,
+                 dim=DEFAULT_DIM, models=None, completion=None, error_rate=0.0, seed=0):
+        """
+        Args:
+            latency (float): Задержка перед любым ответом (секунды)
+            embed_latency (float): Дополнительная задержка на каждый текст эмбеддинга
+            first_token (float): Время до первого токена ответа чата
+            tokens_per_second (float): Скорость генерации (0 - весь ответ сразу)
+            completion (str): Шаблон ответа чата ({diagnosis} - диагноз из системного сообщения)
+            error_rate (float): Доля запросов, на которые сервер отвечает 500
+        """
+        self.latency = latency
+        self.embed_latency = embed_latency
+        self.first_token = first_token
+        self.tokens_per_second = tokens_per_second
+        self.dim = dim
+        self.models = models or DEFAULT_MODELS
+        self.completion = completion or CANNED_COMPLETION
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = {}
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def token_delay(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+def completion_text(settings, messages):
+    """Заготовленный ответ с диагнозом из системного сообщения (если он там есть)"""
+    diagnosis = "не указан"
+    for message in messages or []:
+        match = DIAGNOSIS_PATTERN.search(str(message.get("content", "")))
+        if match:
+            diagnosis = match.group(1).strip()
+            break
+    return settings.completion.replace("{diagnosis}", diagnosis)
+
+
+class FakeOllamaHandler(http.server.BaseHTTPRequestHandler):
+    # keep-alive, как у Ollama: клиенты с пулом соединений переиспользуют их
+    protocol_version = "HTTP/1.1"
+    settings = FakeOllamaSettings()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status_code, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json_body(self):
+        content_length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(content_length).decode('utf-8') or "{}")
+
+    def start(self, path):
+        """Общая часть обработки: счетчик, задержка, случайная ошибка"""
+        self.settings.count(path)
+        if self.settings.latency:
+            time.sleep(self.settings.latency)
+        if self.settings.should_fail():
+            self.send_json(500, {"error": "fake_ollama: injected error"})
+            return False
+        return True
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/':
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif path == '/api/tags':
+            if self.start(path):
+                self.send_json(200, {"models": [
+                    {"name": name, "model": name, "size": 0, "digest": hashlib.sha256(name.encode()).hexdigest(),
+                     "modified_at": "2024-01-01T00:00:00Z", "details": {"family": "fake"}}
+                    for name in self.settings.models
+                ]})
+        elif path == '/api/version':
+            self.send_json(200, {"version": "0.0.0-fake"})
+        elif path == '/v1/models':
+            self.send_json(200, {"object": "list", "data": [
+                {"id": name, "object": "model", "created": 0, "owned_by": "fake"} for name in self.settings.models
+            ]})
+        else:
+            self.send_json(404, {"error": f"unknown endpoint {path}"})
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        try:
+            request = self.read_json_body()
+        except (ValueError, UnicodeDecodeError) as e:
+            self.send_json(400, {"error": f"invalid JSON: {e}"})
+            return
+
+        if path not in ('/api/embed', '/api/embeddings', '/v1/chat/completions'):
+            self.send_json(404, {"error": f"unknown endpoint {path}"})
+            return
+        if not self.start(path):
+            return
+
+        if path == '/api/embed':
+            texts = request.get("input", [])
+            texts = [texts] if isinstance(texts, str) else list(texts)
+            if self.settings.embed_latency:
+                time.sleep(self.settings.embed_latency * len(texts))
+            self.send_json(200, {
+                "model": request.get("model", ""),
+                "embeddings": [hashed_embedding(text, self.settings.dim) for text in texts]
+            })
+        elif path == '/api/embeddings':
+            if self.settings.embed_latency:
+                time.sleep(self.settings.embed_latency)
+            self.send_json(200, {"embedding": hashed_embedding(request.get("prompt", ""), self.settings.dim)})
+        else:
+            self.chat_completion(request)
+
+    def chat_completion(self, request):
+        """OpenAI-совместимый ответ чата: целиком или потоком по токенам"""
+        model = request.get("model", self.settings.models[0])
+        messages = request.get("messages") or []
+        tokens = TOKEN_PATTERN.findall(completion_text(self.settings, messages))
+        finish_reason = "stop"
+        max_tokens = request.get("max_tokens")
+        if isinstance(max_tokens, int) and 0 < max_tokens < len(tokens):
+            tokens, finish_reason = tokens[:max_tokens], "length"
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in messages)
+
+        if self.settings.first_token:
+            time.sleep(self.settings.first_token)
+
+        if not request.get("stream"):
+            time.sleep(self.settings.token_delay() * len(tokens))
+            self.send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": finish_reason
+                }],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                          "total_tokens": prompt_tokens + len(tokens)}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def chunk(delta, reason=None):
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": reason}]}
+
+        try:
+            for position, token in enumerate(tokens):
+                if position:
+                    time.sleep(self.settings.token_delay())
+                delta = {"role": "assistant", "content": token} if position == 0 else {"content": token}
+                self.write_event(chunk(delta))
+            self.write_event(chunk({}, finish_reason))
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def write_event(self, data):
+        self.write_chunk(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+    def write_chunk(self, data):
+        """Один фрагмент chunked-ответа (пустой - конец ответа)"""
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOllamaServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_fake_ollama(port=DEFAULT_PORT, host="127.0.0.1", **settings):
+    """
+    Запуск в фоновом потоке (для бенчмарков и проверок в одном процессе)
+
+    Returns:
+        FakeOllamaServer: server.shutdown() - остановка; адрес - http://host:server.server_port
+    """
+    handler = type("ConfiguredFakeOllamaHandler", (FakeOllamaHandler,),
+                   {"settings": FakeOllamaSettings(**settings)})
+    server = FakeOllamaServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Тестовая замена Ollama: эмбеддинги и чат без моделей')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес для прослушивания')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Порт (у настоящей Ollama - 11434)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка перед любым ответом (с)')
+    parser.add_argument('--embed-latency', type=float, default=0.0, help='Задержка на каждый текст эмбеддинга (с)')
+    parser.add_argument('--first-token', type=float, default=0.0, help='Время до первого токена ответа (с)')
+    parser.add_argument('--tokens-per-second', type=float, default=0.0,
+                        help='Скорость генерации (0 - ответ целиком без задержки)')
+    parser.add_argument('--dim', type=int, default=DEFAULT_DIM, help='Размерность эмбеддингов')
+    parser.add_argument('--models', nargs='+', default=DEFAULT_MODELS, help='Модели в /api/tags')
+    parser.add_argument('--completion-file', help='Файл с текстом ответа ({diagnosis} - диагноз пациента)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля запросов с ответом 500')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    completion = None
+    if args.completion_file:
+        with open(args.completion_file, 'r', encoding='utf-8') as f:
+            completion = f.read()
+
+    FakeOllamaHandler.settings = FakeOllamaSettings(
+        latency=args.latency, embed_latency=args.embed_latency, first_token=args.first_token,
+        tokens_per_second=args.tokens_per_second, dim=args.dim, models=args.models,
+        completion=completion, error_rate=args.error_rate, seed=args.seed
+    )
+
+    with FakeOllamaServer((args.host, args.port), FakeOllamaHandler) as server:
+        print(f"🧪 Тестовая Ollama на http://{args.host}:{args.port}: задержка {args.latency}с, "
+              f"первый токен {args.first_token}с, {args.tokens_per_second or '∞'} токенов/с")
+        print(f"   MEDASSIST_OLLAMA_HOST=http://{args.host}:{args.port} python server.py")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n⏹️ Тестовая Ollama остановлена")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Фоновая проверка Ollama для /api/health и /api/models
+Эндпоинты отдают готовый снимок из памяти, а не запускают `ollama list` на каждый вызов
+"""
+import json
+import threading
+import time
+import urllib.request
+
+from config import HEALTH_PROBE_INTERVAL, HEALTH_PROBE_TIMEOUT, OLLAMA_HOST
+
+
+class OllamaProbe:
+    def __init__(self, host=OLLAMA_HOST, interval=HEALTH_PROBE_INTERVAL, timeout=HEALTH_PROBE_TIMEOUT):
+        """
+        Args:
+            host (str): Адрес Ollama (http://host:port)
+            interval (float): Период опроса /api/tags, секунды
+            timeout (float): Таймаут одного опроса, секунды
+        """
+        self.host = host
+        self.interval = interval
+        self.timeout = timeout
+        # Снимок заменяется целиком: читатели не берут блокировок
+        self._snapshot = {
+            "ollama": "unknown",
+            "models": [],
+            "error": None,
+            "probe_time": None,
+            "checked_at": None
+        }
+        self._stop = threading.Event()
+        self._thread = None
+        self._recovery_callbacks = []
+
+    def on_recovered(self, callback):
+        """callback() вызывается, когда Ollama снова отвечает после ошибки или при первом ответе"""
+        self._recovery_callbacks.append(callback)
+
+    def probe(self):
+        """Один опрос Ollama; результат становится текущим снимком"""
+        start_time = time.time()
+        try:
+            with urllib.request.urlopen(f"{self.host}/api/tags", timeout=self.timeout) as response:
+                tags = json.loads(response.read().decode('utf-8'))
+            snapshot = {
+                "ollama": "running",
+                "models": [model.get("name") or model.get("model") for model in tags.get("models", [])],
+                "error": None
+            }
+        except Exception as e:
+            # Список моделей оставляем прежним: GUI не теряет выбор при кратком сбое
+            snapshot = {"ollama": "error", "models": self._snapshot["models"], "error": str(e)}
+
+        snapshot["probe_time"] = round(time.time() - start_time, 3)
+        snapshot["checked_at"] = time.time()
+        recovered = snapshot["ollama"] == "running" and self._snapshot["ollama"] != "running"
+        self._snapshot = snapshot
+        if recovered:
+            for callback in self._recovery_callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"⚠️ Ошибка обработчика восстановления Ollama: {e}")
+        return snapshot
+
+    def snapshot(self):
+        """
+        Текущий снимок и его возраст
+
+        Returns:
+            tuple: (снимок, возраст в секундах или None, если опроса еще не было)
+        """
+        snapshot = self._snapshot
+        checked_at = snapshot["checked_at"]
+        age = round(time.time() - checked_at, 3) if checked_at is not None else None
+        return snapshot, age
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Запуск фонового опроса (первый опрос - сразу)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ollama-probe", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
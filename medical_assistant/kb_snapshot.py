@@ -0,0 +1,120 @@
+"""
+Снимки баз знаний: скомпилированный JSON в бинарном виде рядом с исходным файлом
+Вместо разбора и компиляции каждый запуск - отображение снимка в память (mmap) и marshal.loads.
+Снимок годится, только если совпадают размер и SHA-256 исходного файла: замена файла
+с сохранением времени изменения (cp -p, git checkout) тоже приводит к пересборке
+
+    python kb_snapshot.py            # заранее собрать снимок КлинРек для решателя
+"""
+import hashlib
+import json
+import marshal
+import mmap
+import os
+import struct
+
+from config import KB_PATH, KB_SNAPSHOT_DIR
+
+SNAPSHOT_MAGIC = b"MAKB"
+SNAPSHOT_SUFFIX = ".snapshot"
+
+# Заголовок: магия, версия marshal, вид снимка, mtime_ns, размер и SHA-256 исходного файла
+HEADER = struct.Struct("<4sH16sqq32s")
+
+
+def snapshot_path(source_path, kind):
+    """Путь снимка: рядом с исходным файлом или в MEDASSIST_KB_SNAPSHOT_DIR"""
+    directory = KB_SNAPSHOT_DIR or os.path.dirname(os.path.abspath(source_path))
+    return os.path.join(directory, f"{os.path.basename(source_path)}.{kind}{SNAPSHOT_SUFFIX}")
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+def read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_snapshot(path, kind, stat, digest):
+    """
+    Данные из снимка, если он собран из текущей версии исходного файла
+
+    Args:
+        stat: os.stat исходного файла
+        digest (bytes): SHA-256 исходного файла (mtime не проверяется: его сохраняют cp -p и git)
+
+    Returns:
+        Данные или None, если снимок не подходит
+    """
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if len(mm) < HEADER.size:
+                return None
+            magic, version, snapshot_kind, _, size, snapshot_digest = HEADER.unpack_from(mm)
+            if magic != SNAPSHOT_MAGIC or version != marshal.version or \
+                    snapshot_kind.rstrip(b"\0").decode() != kind or size != stat.st_size or \
+                    digest != snapshot_digest:
+                return None
+            with memoryview(mm) as view:
+                return marshal.loads(view[HEADER.size:])
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+
+
+def write_snapshot(path, kind, stat, digest, data):
+    """Атомарная запись снимка (через временный файл)"""
+    header = HEADER.pack(SNAPSHOT_MAGIC, marshal.version, kind.encode(), stat.st_mtime_ns,
+                         stat.st_size, digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(marshal.dumps(data))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_snapshot(source_path, kind, build):
+    """
+    Данные исходного файла через снимок
+
+    Args:
+        kind (str): Вид снимка (до 16 байт); менять при изменении формата build
+        build (callable): Разбор исходного файла, если снимок устарел -
+            результат должен состоять из простых типов (dict, list, tuple, str, числа)
+
+    Returns:
+        Результат build (из снимка или свежий)
+    """
+    stat = os.stat(source_path)
+    path = snapshot_path(source_path, kind)
+    # SHA-256 файла базы (сотни КБ) - доли миллисекунды, дешевле разбора JSON
+    digest = file_digest(source_path)
+    data = read_snapshot(path, kind, stat, digest)
+    if data is not None:
+        return data
+
+    data = build()
+    try:
+        write_snapshot(path, kind, stat, digest, data)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Не удалось сохранить снимок {os.path.basename(path)}: {e}")
+    return data
+
+
+def main():
+    from solver import SOLVER_SNAPSHOT_KIND, ClinicalSolver
+
+    solver = ClinicalSolver.from_file(KB_PATH)
+    print(f"✅ {os.path.basename(KB_PATH)}: {len(solver.records)} инструкций, "
+          f"{snapshot_path(KB_PATH, SOLVER_SNAPSHOT_KIND)}")
+
+
+if __name__ == "__main__":
+    main()
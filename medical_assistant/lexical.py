@@ -0,0 +1,123 @@
+"""
+Лексический поиск BM25 по базе параграфов
+Инвертированный индекс с легким стеммингом русских окончаний
+"""
+import heapq
+import math
+import re
+from collections import Counter
+
+# Окончания в порядке убывания длины: отсекается самое длинное подходящее
+RUSSIAN_ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'иях', 'иям', 'ием', 'ией', 'ого', 'его', 'ому', 'ему',
+    'ыми', 'ими', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ей',
+    'ых', 'их', 'ую', 'юю', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем',
+    'ия', 'ию', 'ью', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь'
+], key=len, reverse=True)
+
+STOPWORDS = {
+    'и', 'в', 'во', 'не', 'на', 'с', 'со', 'по', 'для', 'при', 'или', 'до', 'от',
+    'из', 'к', 'ко', 'у', 'о', 'об', 'а', 'но', 'что', 'как', 'это', 'то', 'же',
+    'за', 'под', 'над', 'без', 'его', 'ее', 'их', 'мг', 'г', 'мл'
+}
+
+MIN_STEM_LENGTH = 4
+# Длинные слова сначала обрезаются: так совпадают формы с разной длиной окончания
+MAX_PREFIX_LENGTH = 6
+
+TOKEN_RE = re.compile(r"[а-яa-z0-9]+")
+
+
+def stem(word):
+    """Легкий стемминг: перелом/переломы/переломов -> перел"""
+    if word.isdigit():
+        return word
+    word = word[:MAX_PREFIX_LENGTH]
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    """Термы текста: нижний регистр, ё -> е, без стоп-слов, со стеммингом"""
+    words = TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+    return [stem(word) for word in words if word not in STOPWORDS]
+
+
+class LexicalIndex:
+    def __init__(self, documents, k1=1.5, b=0.75, max_df_ratio=0.5):
+        """
+        Args:
+            documents (list): Тексты строк индекса (в том же порядке, что и векторный индекс)
+            k1, b: Параметры BM25
+            max_df_ratio (float): Термы, встречающиеся в большей доле документов,
+                при поиске пропускаются (их вес почти нулевой, а списки самые длинные)
+        """
+        self.size = len(documents)
+        self.postings = {}
+        self.max_df = max(1, int(self.size * max_df_ratio))
+
+        term_counts = [Counter(tokenize(document)) for document in documents]
+        self.doc_terms = [frozenset(counts) for counts in term_counts]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        avg_length = (sum(lengths) / self.size) if self.size else 0.0
+
+        document_frequency = Counter()
+        for counts in term_counts:
+            document_frequency.update(counts.keys())
+
+        # Вес BM25 терма в документе считается заранее: поиск - только сумма весов
+        for doc, counts in enumerate(term_counts):
+            length_norm = k1 * (1 - b + b * lengths[doc] / avg_length) if avg_length else k1
+            for term, tf in counts.items():
+                df = document_frequency[term]
+                idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+                weight = idf * tf * (k1 + 1) / (tf + length_norm)
+                self.postings.setdefault(term, []).append((doc, weight))
+
+    def __len__(self):
+        return self.size
+
+    def search(self, query, k, rows=None):
+        """
+        Top-k документов по BM25
+
+        Args:
+            query (str): Текст запроса
+            rows (set): Искать только среди этих документов (раздел)
+
+        Returns:
+            list: (номер документа, оценка) по убыванию оценки
+        """
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if postings is None or len(postings) > self.max_df:
+                continue
+            for doc, weight in postings:
+                if rows is None or doc in rows:
+                    scores[doc] = scores.get(doc, 0.0) + weight
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def contains_any(self, doc, terms):
+        """Есть ли в документе хотя бы один из термов"""
+        return not self.doc_terms[doc].isdisjoint(terms)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Слияние нескольких ранжирований (RRF)
+
+    Args:
+        rankings (list): Списки номеров документов, лучшие - первыми
+
+    Returns:
+        list: (номер документа, оценка RRF) по убыванию оценки
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            fused[doc] = fused.get(doc, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,85 @@
+"""
+Ограничение параллельных тяжелых запросов (генерация LLM)
+Пул рабочих слотов + ограниченная очередь ожидания
+"""
+import threading
+from contextlib import contextmanager
+
+
+class QueueFullError(Exception):
+    """Очередь запросов переполнена"""
+
+
+class RequestLimiter:
+    def __init__(self, max_workers=2, max_queue=8):
+        """
+        Args:
+            max_workers (int): Сколько тяжелых запросов выполняется одновременно
+            max_queue (int): Сколько запросов может ждать свободного слота
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, timeout=None):
+        """
+        Занимает рабочий слот на время выполнения запроса
+        Бросает QueueFullError, если очередь заполнена или ожидание истекло
+        """
+        with self._cond:
+            if self.active >= self.max_workers:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise QueueFullError("Очередь запросов переполнена")
+
+                self.waiting += 1
+                try:
+                    acquired = self._cond.wait_for(
+                        lambda: self.active < self.max_workers, timeout=timeout
+                    )
+                finally:
+                    self.waiting -= 1
+
+                if not acquired:
+                    self.rejected += 1
+                    raise QueueFullError("Превышено время ожидания в очереди")
+
+            self.active += 1
+
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire_free(self, count):
+        """
+        Занимает до count свободных слотов без ожидания (дополнительные слоты пакета)
+        Занятые слоты возвращаются через release
+
+        Returns:
+            int: Сколько слотов занято (0, если свободных нет)
+        """
+        with self._cond:
+            acquired = max(0, min(count, self.max_workers - self.active))
+            self.active += acquired
+            return acquired
+
+    def release(self, count=1):
+        with self._cond:
+            self.active -= count
+            self._cond.notify(count)
+
+    def status(self):
+        """Состояние пула для /api/health"""
+        with self._cond:
+            return {
+                "workers": self.max_workers,
+                "active": self.active,
+                "queued": self.waiting,
+                "queue_size": self.max_queue,
+                "rejected": self.rejected
+            }
@@ -0,0 +1,220 @@
+"""
+Метрики сервера в текстовом формате Prometheus (/api/metrics)
+Счетчики запросов и ошибок, гистограммы задержек по этапам конвейера;
+состояние кэшей, очереди и соединений снимается в момент запроса метрик.
+Без prometheus_client: короткие блокировки на метрику, запрос метрик не ждет обработчиков
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from profiling import current_profile
+
+# Границы корзин гистограмм (секунды): от попаданий в кэш до долгой генерации
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_sample(name, labels, value):
+    """Строка образца: name{label="value"} 1.5"""
+    if labels:
+        label_text = ",".join(f'{key}="{escape_label(item)}"' for key, item in labels.items())
+        name = f"{name}{{{label_text}}}"
+    if isinstance(value, float):
+        value = format_bound(value)
+    return f"{name} {value}"
+
+
+def format_bound(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.labels, key)), value) for key, value in sorted(items)]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # метки -> [счетчики корзин (последняя - +Inf), сумма]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(label_values) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[position] += 1
+            self._values[label_values] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        samples = []
+        for key, counts, total in sorted(items):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": format_bound(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, round(total, 6)))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        Функция, вызываемая при каждом запросе метрик
+
+        collector() -> [(имя, тип, описание, [(метки, значение), ...]), ...]
+        """
+        self.collectors.append(collector)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(format_sample(name, labels, value) for name, labels, value in metric.samples())
+
+        for collector in self.collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                lines.append(f"# collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, metric_type, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.extend(format_sample(name, labels, value) for labels, value in samples)
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "medassist_http_requests_total", "Запросы к API по обработчику и коду ответа", ("endpoint", "status")
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "medassist_http_request_duration_seconds", "Время обработки запроса к API", ("endpoint",)
+)
+STAGE_DURATION = REGISTRY.histogram(
+    "medassist_stage_duration_seconds", "Время этапа конвейера рекомендаций", ("stage",)
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "medassist_stage_errors_total", "Ошибки на этапе конвейера рекомендаций", ("stage",)
+)
+
+
+def observe(stage, seconds):
+    """
+    Время этапа, измеренное вручную (например, до первого токена)
+    Попадает и в профиль запроса, если он включен (?profile=1)
+    """
+    STAGE_DURATION.observe(seconds, stage)
+    profile = current_profile()
+    if profile is not None:
+        profile.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    """
+    Замер этапа конвейера: время в гистограмму, исключение - в счетчик ошибок этапа
+
+        with timed("embedding"):
+            embedding = embed_query(...)
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage)
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start_time)
+
+
+def cache_families(caches):
+    """
+    Метрики кэшей по их stats(): попадания, промахи, размер, доля попаданий
+
+    Args:
+        caches (dict): {имя кэша: stats()}
+    """
+    def samples(key):
+        return [({"cache": name}, stats.get(key, 0)) for name, stats in caches.items()]
+
+    return [
+        ("medassist_cache_hits_total", "counter", "Попадания в кэш", samples("hits")),
+        ("medassist_cache_misses_total", "counter", "Промахи кэша", samples("misses")),
+        ("medassist_cache_entries", "gauge", "Записей в кэше (в памяти)", samples("size")),
+        ("medassist_cache_hit_ratio", "gauge", "Доля попаданий в кэш", samples("hit_rate")),
+    ]
+
+
+def limiter_families(status):
+    """Метрики очереди тяжелых запросов по RequestLimiter.status()"""
+    return [
+        ("medassist_queue_depth", "gauge", "Запросов рекомендаций в очереди", [({}, status["queued"])]),
+        ("medassist_workers_active", "gauge", "Занятых рабочих слотов", [({}, status["active"])]),
+        ("medassist_workers", "gauge", "Всего рабочих слотов", [({}, status["workers"])]),
+        ("medassist_requests_rejected_total", "counter", "Запросов отклонено с 503",
+         [({}, status["rejected"])]),
+    ]
+
+
+def connection_families(stats):
+    """Метрики HTTP клиентов Ollama по clients.connection_stats()"""
+    def samples(key):
+        return [({"client": name}, client_stats[key]) for name, client_stats in stats.items()]
+
+    return [
+        ("medassist_upstream_requests_total", "counter", "Запросы к Ollama", samples("requests")),
+        ("medassist_upstream_connections_total", "counter", "Новые соединения с Ollama",
+         samples("new_connections")),
+        ("medassist_upstream_connection_reuse_ratio", "gauge", "Доля запросов по открытым соединениям",
+         samples("reuse_rate")),
+    ]
@@ -0,0 +1,114 @@
+"""
+Разделы базы параграфов по заболеваниям
+Каждый файл data/<Заболевание> параграфы.txt - отдельный раздел
+"""
+import os
+import re
+
+PARAGRAPHS_SUFFIX = " параграфы"
+
+# Основы слов из названий, по которым нельзя различать заболевания: общие слова и
+# начала, с которых начинаются и другие диагнозы (гипертиреоз, артроз сустава, вирусная пневмония)
+GENERIC_STEMS = {
+    'перел', 'повре', 'вывих', 'прокс', 'отдел', 'кости', 'косте',
+    'хрони', 'стаби', 'остры', 'парагр', 'кроме', 'диста',
+    'гипер', 'артер', 'вирус', 'гепат', 'суста', 'колен', 'голен', 'позво',
+    'остео', 'расст', 'спект'
+}
+
+# Ключи вместо общих основ, синонимы и сокращения, которых нет в названиях:
+# начало слова (от STEM_LENGTH букв) или короткое сокращение целиком;
+# строка с пробелом - слова подряд ("гепатит с"), кортеж - все ключи в любом месте диагноза.
+# Названия - без пояснения в скобках, кириллицей (см. alias_name)
+DISEASE_ALIASES = {
+    "Стабильная ИБС": [("ишемическ", "сердц"), "стенокард"],
+    "Хронический вирусный гепатит С": ["гепатит с", "гепатит c", "хвгс", "вгс"],
+    "Артериальная гипертензия": ["гипертенз", "гипертони", "аг"],
+    "Повреждение связок коленного сустава": ["связк", "крестообразн"],
+    "Вывих шейного позвонка": ["позвонк"],
+    "Переломы проксимального отдела костей голени": ["голени", "большеберц"],
+}
+
+# Латинские буквы, которые пишут вместо кириллических в названиях («гепатит C»)
+HOMOGLYPHS = str.maketrans("ACEHKMOPTXaceopx", "АСЕНКМОРТХасеорх")
+
+STEM_LENGTH = 5
+
+
+def disease_from_filename(filepath):
+    """Название заболевания по имени файла параграфов"""
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    if name.endswith(PARAGRAPHS_SUFFIX):
+        name = name[:-len(PARAGRAPHS_SUFFIX)]
+    return name.strip()
+
+
+def tokens(text):
+    """Слова текста по порядку (включая однобуквенные), нижний регистр, ё -> е"""
+    return re.findall(r"\w+", text.lower().replace('ё', 'е'))
+
+
+def words(text):
+    """Значимые слова текста: от двух букв, без чисел"""
+    return {word for word in tokens(text) if len(word) >= 2 and not word.isdigit()}
+
+
+def word_stems(text):
+    """Грубые основы слов: первые STEM_LENGTH букв"""
+    return {word[:STEM_LENGTH] for word in words(text)}
+
+
+def alias_name(disease):
+    """Название раздела для DISEASE_ALIASES: без пояснения в скобках, латиница -> кириллица"""
+    return re.sub(r"\s*\(.*?\)", "", disease).translate(HOMOGLYPHS).strip()
+
+
+def disease_keys(disease):
+    """
+    Ключи раздела: отличительные основы слов названия и синонимы
+
+    Returns:
+        list: Кортежи ключей; раздел подходит, если все ключи одного кортежа есть в диагнозе
+    """
+    keys = [(stem,) for stem in sorted(word_stems(disease)) if len(stem) >= 3 and stem not in GENERIC_STEMS]
+    keys.extend(
+        alias if isinstance(alias, tuple) else (alias,) for alias in DISEASE_ALIASES.get(alias_name(disease), [])
+    )
+    return keys
+
+
+def word_matches(key, word):
+    """Короткий ключ (сокращение, буква) - только целым словом, длинный - как начало слова"""
+    if len(key) < STEM_LENGTH:
+        return word == key
+    return word.startswith(key)
+
+
+def key_found(key, diagnosis_tokens):
+    """Ключ из одного или нескольких слов подряд среди слов диагноза"""
+    parts = key.split()
+    return any(
+        all(word_matches(part, word) for part, word in zip(parts, diagnosis_tokens[start:start + len(parts)]))
+        for start in range(len(diagnosis_tokens) - len(parts) + 1)
+    )
+
+
+def match_partitions(diagnosis, diseases):
+    """
+    Разделы, к которым относится диагноз
+
+    Args:
+        diagnosis (str): Текст диагноза
+        diseases (iterable): Известные разделы
+
+    Returns:
+        list: Подходящие разделы (пустой список - искать по всей базе)
+    """
+    if not diagnosis:
+        return []
+
+    diagnosis_tokens = tokens(diagnosis)
+    return [
+        disease for disease in diseases
+        if any(all(key_found(part, diagnosis_tokens) for part in key) for key in disease_keys(disease))
+    ]
@@ -0,0 +1,134 @@
+"""
+Профилирование отдельного запроса по требованию (?profile=1 или заголовок X-Profile: 1)
+Время этапов конвейера собирается через contextvar текущего запроса: metrics.observe
+добавляет каждый замер в профиль, если он включен. Без флага профиль не создается.
+При заданном MEDASSIST_PROFILE_DIR запрос с флагом дополнительно пишет файл cProfile (.pstats)
+"""
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import PROFILE_DIR
+
+# Профиль текущего запроса (None - профилирование выключено)
+CURRENT_PROFILE = ContextVar("medassist_profile", default=None)
+
+PROFILE_FLAG_VALUES = ("1", "true", "yes", "on")
+
+_counter_lock = threading.Lock()
+_counter = 0
+
+
+def profile_requested(query_values, header_value):
+    """Флаг профилирования из параметра ?profile= или заголовка X-Profile"""
+    values = list(query_values or []) + ([header_value] if header_value else [])
+    return any(str(value).strip().lower() in PROFILE_FLAG_VALUES for value in values)
+
+
+def next_dump_path(dump_dir, name):
+    """Уникальное имя файла .pstats: время, номер запроса, обработчик"""
+    global _counter
+    with _counter_lock:
+        _counter += 1
+        number = _counter
+    return os.path.join(dump_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{number}-{name}.pstats")
+
+
+class RequestProfile:
+    def __init__(self, name, dump_dir=None):
+        """
+        Args:
+            name (str): Имя обработчика для файла .pstats
+            dump_dir (str): Папка для файлов cProfile (пусто - без cProfile)
+        """
+        self.start_time = time.perf_counter()
+        self.stages = {}
+        self.profiler = None
+        self.dump_path = None
+        self.dump_error = None
+        if dump_dir:
+            self.dump_path = next_dump_path(dump_dir, name)
+
+    def add(self, stage, seconds):
+        """Замер этапа (повторные замеры одного этапа суммируются)"""
+        seconds_total, calls = self.stages.get(stage, (0.0, 0))
+        self.stages[stage] = (seconds_total + seconds, calls + 1)
+
+    def start_cprofile(self):
+        if not self.dump_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.dump_path), exist_ok=True)
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        except (OSError, ValueError) as e:
+            # ValueError: другой профилировщик уже активен (параллельный запрос с флагом)
+            self.profiler = None
+            self.dump_error = str(e)
+            print(f"⚠️ cProfile для запроса не запущен: {e}")
+
+    def stop_cprofile(self):
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        try:
+            self.profiler.dump_stats(self.dump_path)
+            print(f"📝 Профиль запроса: {self.dump_path}")
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить профиль запроса: {e}")
+
+    def summary(self):
+        """
+        Разбивка времени запроса для ответа API
+
+        Returns:
+            dict: total, stages {этап: {seconds, calls}} в порядке первого замера,
+                unaccounted (время вне замеренных этапов), pstats (путь файла cProfile)
+        """
+        total = time.perf_counter() - self.start_time
+        # first_token - часть completion, в сумму этапов не входит
+        accounted = sum(seconds for stage, (seconds, _) in self.stages.items() if stage != "first_token")
+        return {
+            "total": round(total, 4),
+            "stages": {
+                stage: {"seconds": round(seconds, 4), "calls": calls}
+                for stage, (seconds, calls) in self.stages.items()
+            },
+            "unaccounted": round(max(0.0, total - accounted), 4),
+            "pstats": self.dump_path if self.profiler is not None else None,
+            "pstats_error": self.dump_error
+        }
+
+
+def current_profile():
+    return CURRENT_PROFILE.get()
+
+
+@contextmanager
+def request_profile(enabled, name="request", dump_dir=PROFILE_DIR):
+    """
+    Профиль на время обработки запроса
+
+        with request_profile(flag, "recommendations") as profile:
+            ...
+            if profile is not None:
+                response["profile"] = profile.summary()
+
+    Yields:
+        RequestProfile или None, если флаг не задан
+    """
+    if not enabled:
+        yield None
+        return
+
+    profile = RequestProfile(name, dump_dir)
+    token = CURRENT_PROFILE.set(profile)
+    profile.start_cprofile()
+    try:
+        yield profile
+    finally:
+        profile.stop_cprofile()
+        CURRENT_PROFILE.reset(token)
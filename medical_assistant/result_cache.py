@@ -0,0 +1,151 @@
+"""
+Кэш готовых рекомендаций
+Ключ: хэш нормализованных данных пациента, модели, диагноза,
+версии шаблона промпта и версии базы параграфов
+Уровни: LRU в памяти + необязательный уровень на диске с TTL
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from caching import LRUCache
+from config import OLLAMA_HOST, RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_DIR
+
+
+def normalize_patient_data(value):
+    """
+    Каноническая форма данных пациента:
+    строки без лишних пробелов, пустые значения отброшены
+    """
+    if isinstance(value, dict):
+        normalized = {}
+        for key, item in value.items():
+            item = normalize_patient_data(item)
+            if item not in (None, "", [], {}):
+                normalized[str(key).strip()] = item
+        return normalized
+    if isinstance(value, (list, tuple)):
+        return [normalize_patient_data(item) for item in value]
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return value
+
+
+def recommendation_key(model, diagnosis, patient_data, prompt_version, vault_version, host=OLLAMA_HOST):
+    """Ключ кэша: SHA-256 канонического JSON запроса и адреса Ollama, которая генерирует ответ"""
+    payload = {
+        "host": host,
+        "model": model,
+        "diagnosis": " ".join(str(diagnosis).split()).lower(),
+        "patient_data": normalize_patient_data(patient_data),
+        "prompt_version": prompt_version,
+        "vault_version": vault_version
+    }
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class RecommendationCache:
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, disk_dir=RESULT_CACHE_DIR):
+        """
+        Args:
+            maxsize (int): Размер уровня в памяти (0 - кэш выключен)
+            ttl (float): Время жизни записи в секундах
+            disk_dir (str): Папка дискового уровня (пусто - без диска)
+        """
+        self.enabled = maxsize > 0
+        self.ttl = ttl or None
+        self.memory = LRUCache(max(1, maxsize), self.ttl)
+        self.disk_dir = disk_dir or None
+        self.disk_hits = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        if self.enabled and self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self.evict_expired()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _expired(self, mtime):
+        return self.ttl is not None and time.time() - mtime > self.ttl
+
+    def get(self, key):
+        """Результат по ключу или None"""
+        if not self.enabled:
+            return None
+
+        value = self.memory.get(key)
+        if value is not None or not self.disk_dir:
+            return value
+
+        path = self._disk_path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+        self.memory.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """Сохраняет результат в память и (если включен) на диск"""
+        if not self.enabled:
+            return
+
+        self.memory.put(key, value)
+        if not self.disk_dir:
+            return
+
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить результат в кэш на диске: {e}")
+
+        with self._lock:
+            self._puts += 1
+            sweep = self._puts % 100 == 0
+        if sweep:
+            self.evict_expired()
+
+    def evict_expired(self):
+        """Удаляет с диска записи старше TTL"""
+        if not self.disk_dir or self.ttl is None:
+            return 0
+
+        removed = 0
+        for filename in os.listdir(self.disk_dir):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.disk_dir, filename)
+            try:
+                if self._expired(os.path.getmtime(path)):
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+
+        if removed:
+            print(f"🧹 Удалено устаревших рекомендаций из кэша: {removed}")
+        return removed
+
+    def stats(self):
+        """Счетчики для /api/health"""
+        stats = self.memory.stats()
+        stats["enabled"] = self.enabled
+        stats["disk_dir"] = self.disk_dir
+        stats["disk_hits"] = self.disk_hits
+        return stats
@@ -0,0 +1,110 @@
+"""
+Векторный поиск по базе параграфов на NumPy
+Матрица эмбеддингов хранится один раз: непрерывная, float32, уже нормированная
+"""
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """L2-нормировка строк (нулевые строки остаются нулевыми)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorIndex:
+    def __init__(self, embeddings, labels=None):
+        """
+        Args:
+            embeddings: Матрица эмбеддингов (список списков, numpy или torch CPU тензор)
+            labels (list): Раздел каждой строки (например, заболевание) - для поиска внутри раздела
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1) if matrix.size else np.zeros((0, 0), dtype=np.float32)
+        self.matrix = np.ascontiguousarray(normalize_rows(matrix), dtype=np.float32)
+
+        # Разделы: номера строк и своя непрерывная подматрица
+        self.partitions = {}
+        if labels is not None and len(labels) == len(self.matrix):
+            groups = {}
+            for row, label in enumerate(labels):
+                groups.setdefault(label, []).append(row)
+            for label, rows in groups.items():
+                rows = np.asarray(rows, dtype=np.int64)
+                self.partitions[label] = (rows, np.ascontiguousarray(self.matrix[rows]))
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def normalize_query(self, query_embedding):
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else query
+
+    def scores(self, query_embedding):
+        """Косинусное сходство запроса со всеми параграфами (одно умножение матрицы на вектор)"""
+        return self.matrix @ self.normalize_query(query_embedding)
+
+    def row_scores(self, query_embedding, rows):
+        """Косинусное сходство запроса с выбранными строками"""
+        rows = np.asarray(rows, dtype=np.int64)
+        return self.matrix[rows] @ self.normalize_query(query_embedding)
+
+    def partition_rows(self, partitions):
+        """Множество строк разделов (None - все строки)"""
+        if not partitions:
+            return None
+        rows = set()
+        for label in partitions:
+            if label in self.partitions:
+                rows.update(self.partitions[label][0].tolist())
+        return rows
+
+    def search(self, query_embedding, k, partitions=None):
+        """
+        Top-k по косинусному сходству
+
+        Args:
+            partitions (list): Искать только в этих разделах (None - по всей базе)
+
+        Returns:
+            tuple: (индексы, оценки) по убыванию оценки
+        """
+        if not partitions:
+            return top_k_indices(self.scores(query_embedding), k)
+
+        query = self.normalize_query(query_embedding)
+        rows, scores = [], []
+        for label in partitions:
+            if label in self.partitions:
+                partition_rows, partition_matrix = self.partitions[label]
+                rows.append(partition_rows)
+                scores.append(partition_matrix @ query)
+
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        rows = np.concatenate(rows)
+        order, top_scores = top_k_indices(np.concatenate(scores), k)
+        return rows[order], top_scores
+
+
+def top_k_indices(scores, k):
+    """Частичный отбор top-k (argpartition) и сортировка только отобранных"""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+
+    order = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return order, scores[order]
@@ -3,21 +3,177 @@
 ИСПРАВЛЕННЫЙ API сервер для медицинского ассистента
 С RAG и базой знаний из параграфов
 """
+import argparse
 import http.server
 import socketserver
 import json
-import subprocess
 import os
 import time
 import sys
-import glob
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from urllib.parse import urlparse, parse_qs
 
 PORT = 5001
 
 # Добавляем путь к core.py
 sys.path.insert(0, os.path.dirname(__file__))
-from core import MedicalAssistant
+from clients import connection_stats
+from config import (
+    SERVER_WORKERS, SERVER_QUEUE_SIZE, SERVER_RETRY_AFTER, RESULT_CACHE_DIR,
+    BATCH_MAX_ITEMS, BATCH_CONCURRENCY, EMBEDDING_MODEL, PROFILE_DIR
+)
+from core import MedicalAssistant, PROMPT_TEMPLATE_VERSION
+from embeddings import QUERY_EMBEDDING_CACHE, embed_queries
+from health import OllamaProbe
+from limiter import RequestLimiter, QueueFullError
+from metrics import (
+    HTTP_REQUEST_DURATION, HTTP_REQUESTS, REGISTRY, cache_families, connection_families,
+    limiter_families, timed
+)
+from profiling import profile_requested, request_profile
+from result_cache import RecommendationCache, recommendation_key
+from solver import get_solver
+from vault import TreatmentVault
+
+# Общая база параграфов: строится один раз при старте
+VAULT = TreatmentVault()
+
+# Пул слотов для тяжелых запросов (генерация LLM)
+LIMITER = RequestLimiter(SERVER_WORKERS, SERVER_QUEUE_SIZE)
+RETRY_AFTER = SERVER_RETRY_AFTER
+
+# Кэш готовых рекомендаций
+RESULT_CACHE = RecommendationCache()
+
+# Состояние Ollama обновляется в фоне; /api/health и /api/models читают снимок
+OLLAMA_PROBE = OllamaProbe()
+
+# Папка файлов cProfile для запросов с ?profile=1 (--profile-dir)
+PROFILE_DUMP_DIR = PROFILE_DIR
+
+# Обработчики с отдельной меткой в метриках (остальные пути - "other")
+METRIC_ENDPOINTS = {
+    '/api/health', '/api/models', '/api/metrics', '/api/get_recommendations',
+    '/api/get_recommendations/stream', '/api/get_recommendations/batch', '/api/solve'
+}
+
+
+def collect_server_metrics():
+    """Состояние кэшей, очереди, соединений и базы на момент запроса метрик"""
+    vault_status = VAULT.status()
+    return [
+        *cache_families({
+            "query_embeddings": QUERY_EMBEDDING_CACHE.stats(),
+            "recommendations": RESULT_CACHE.stats()
+        }),
+        *limiter_families(LIMITER.status()),
+        *connection_families(connection_stats()),
+        ("medassist_vault_ready", "gauge", "База параграфов построена",
+         [({}, int(vault_status["vault_ready"]))]),
+        ("medassist_vault_paragraphs", "gauge", "Параграфов в базе", [({}, vault_status["vault_paragraphs"])]),
+        ("medassist_vault_missing_embeddings", "gauge", "Фрагментов базы без эмбеддинга",
+         [({}, vault_status["vault_missing_embeddings"])]),
+        ("medassist_ollama_up", "gauge", "Ollama отвечала при последней проверке",
+         [({}, int(OLLAMA_PROBE.snapshot()[0]["ollama"] == "running"))]),
+    ]
+
+
+REGISTRY.add_collector(collect_server_metrics)
+
+
+def recommendation_cache_key(vault, diagnosis, patient_data, model):
+    """
+    Кэш: тот же пациент, модель, промпт и версия базы -> готовый ответ
+    Версия берется по разделам диагноза: правка чужого раздела кэш не сбрасывает
+    """
+    vault_version = vault.version_for(MedicalAssistant().extract_diagnosis_from_data(patient_data))
+    return recommendation_key(model, diagnosis, patient_data, PROMPT_TEMPLATE_VERSION, vault_version)
+
+
+def cached_recommendation(vault, cache_key):
+    """
+    Ответ из кэша, если части базы, по которым он построен, не менялись
+    Ключ учитывает только раздел диагноза; поиск мог уйти во всю базу - это проверяется здесь
+    """
+    cached = RESULT_CACHE.get(cache_key)
+    if cached is None:
+        return None
+    if cached.get("vault_version") != vault.partitions_version(cached.get("vault_partitions")):
+        print("🔄 Ответ в кэше построен по изменившимся разделам базы")
+        return None
+    return cached
+
+
+def get_recommendation(vault, diagnosis, patient_data, model, use_cache=True):
+    """
+    Рекомендация для одного пациента на общей базе параграфов (с кэшем результатов)
+    use_cache=False - без поиска в кэше; новый ответ в кэш сохраняется
+
+    Returns:
+        dict: Ответ API (success, recommendation, cached, processing_time, ...)
+    """
+    start_time = time.time()
+    assistant = MedicalAssistant(model=model)
+    with timed("cache"):
+        cache_key = recommendation_cache_key(vault, diagnosis, patient_data, model)
+        cached = cached_recommendation(vault, cache_key) if use_cache else None
+    if cached is not None:
+        print("⚡ Рекомендация взята из кэша")
+        return {**cached, "cached": True, "processing_time": round(time.time() - start_time, 2)}
+    
+    # Данные пациента и общая база параграфов и эмбеддингов
+    assistant.patient_data = patient_data
+    vault.attach(assistant)
+    print(f"✅ База параграфов: {len(assistant.vault_content)} параграфов")
+    
+    print("🧠 Запрос к модели с RAG...")
+    recommendation = assistant.get_treatment_recommendation()
+    processing_time = time.time() - start_time
+    searched_partitions, searched_version = vault.searched_version(assistant)
+    
+    response = {
+        "success": True,
+        "diagnosis": diagnosis,
+        "recommendation": recommendation,
+        "processing_time": round(processing_time, 2),
+        "model": model,
+        "rag_used": len(assistant.vault_content) > 0,
+        "paragraphs_used": len(assistant.vault_content),
+        "vault_partitions": searched_partitions,
+        "vault_version": searched_version
+    }
+    
+    # Ошибки модели и ответы по неполной базе (часть эмбеддингов не получена) не кэшируем
+    if not recommendation.startswith("❌") and not vault.degraded:
+        RESULT_CACHE.put(cache_key, response)
+    
+    print(f"✅ Ответ получен за {processing_time:.1f}с, {len(recommendation)} символов")
+    return {**response, "cached": False}
+
+
+def prefill_query_embeddings(items):
+    """
+    Эмбеддинги поисковых запросов всего пакета одним вызовом embed_texts
+    Дальше get_relevant_context берет их из QUERY_EMBEDDING_CACHE
+    """
+    queries = []
+    for item in items:
+        assistant = MedicalAssistant()
+        assistant.patient_data = item["patient_data"]
+        queries.append(assistant.build_search_query(assistant.default_treatment_query()))
+    
+    start_time = time.time()
+    embeddings = embed_queries(queries, model=EMBEDDING_MODEL)
+    ready = sum(1 for embedding in embeddings if embedding is not None)
+    print(f"🔢 Эмбеддинги запросов пакета: {ready}/{len(queries)} за {time.time() - start_time:.1f}с")
+
+
+class ThreadingMedicalServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Каждое соединение - в своем потоке; тяжелые запросы ограничены LIMITER"""
+    daemon_threads = True
+    allow_reuse_address = True
+
 
 class MedicalAPIHandler(http.server.BaseHTTPRequestHandler):
     
@@ -32,157 +188,419 @@ class MedicalAPIHandler(http.server.BaseHTTPRequestHandler):
     def send_cors_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Profile')
+    
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+    
+    @contextmanager
+    def track_request(self, path):
+        """Счетчик и время запроса для /api/metrics"""
+        self.response_status = None
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            endpoint = path if path in METRIC_ENDPOINTS else "other"
+            HTTP_REQUESTS.inc(endpoint, str(self.response_status or 500))
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start_time, endpoint)
     
     def do_GET(self):
         parsed_path = urlparse(self.path)
-        
+        with self.track_request(parsed_path.path):
+            self.route_get(parsed_path)
+    
+    def do_POST(self):
+        parsed_path = urlparse(self.path)
+        with self.track_request(parsed_path.path):
+            self.route_post(parsed_path)
+    
+    def route_get(self, parsed_path):
         if parsed_path.path == '/api/health':
             self.handle_health_check()
         elif parsed_path.path == '/api/models':
             self.handle_models_list()
+        elif parsed_path.path == '/api/metrics':
+            self.handle_metrics()
         else:
             self.send_error(404, "Endpoint not found")
     
-    def do_POST(self):
-        parsed_path = urlparse(self.path)
-        
+    def route_post(self, parsed_path):
         if parsed_path.path == '/api/get_recommendations':
-            self.handle_recommendations()
+            self.run_limited(self.handle_recommendations)
+        elif parsed_path.path == '/api/get_recommendations/stream':
+            self.run_limited(self.handle_recommendations_stream)
+        elif parsed_path.path == '/api/get_recommendations/batch':
+            self.run_limited(self.handle_recommendations_batch)
+        elif parsed_path.path == '/api/solve':
+            # Решатель не обращается к модели: без очереди LIMITER
+            self.handle_solve()
         else:
             self.send_error(404, "Endpoint not found")
     
-    def handle_health_check(self):
-        """Проверка здоровья сервера"""
+    def run_limited(self, handler):
+        """Выполняет тяжелый обработчик в рабочем слоте или отвечает 503"""
         try:
-            # Проверяем Ollama
-            result = subprocess.run(
-                ['ollama', 'list'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            
-            # Проверяем наличие параграфов лечения
-            data_dir = os.path.join(os.path.dirname(__file__), "data")
-            paragraphs_count = 0
-            if os.path.exists(data_dir):
-                txt_files = glob.glob(os.path.join(data_dir, "*.txt"))
-                for txt_file in txt_files:
-                    with open(txt_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        paragraphs_count += content.count('\n1.') + content.count('\n2.') + content.count('\n3.')
-            
-            response = {
-                "status": "healthy",
-                "ollama": "running" if result.returncode == 0 else "error",
-                "rag_ready": paragraphs_count > 0,
-                "paragraphs_loaded": paragraphs_count,
-                "port": PORT
-            }
-            
-            self.send_json_response(200, response)
-            
-        except Exception as e:
-            self.send_json_response(503, {"status": "degraded", "error": str(e)})
+            with LIMITER.slot():
+                handler()
+        except QueueFullError as e:
+            print(f"⛔ {e}, запрос отклонен")
+            self.send_overloaded_response(str(e))
+    
+    def send_overloaded_response(self, reason):
+        """Ответ 503 с Retry-After при переполненной очереди"""
+        data = {
+            "error": reason,
+            "success": False,
+            "retry_after": RETRY_AFTER,
+            "workers": LIMITER.status()
+        }
+        self.send_response(503)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Retry-After', str(RETRY_AFTER))
+        self.send_cors_headers()
+        self.end_headers()
+        self.wfile.write(json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+    
+    def handle_health_check(self):
+        """Проверка здоровья сервера (из снимков в памяти, без обращений к Ollama и диску)"""
+        snapshot, snapshot_age = OLLAMA_PROBE.snapshot()
+        vault_status = VAULT.status()
+        
+        response = {
+            "status": "healthy" if snapshot["ollama"] == "running" else "degraded",
+            "ollama": snapshot["ollama"],
+            "ollama_error": snapshot["error"],
+            "rag_ready": (vault_status["vault_ready"] and vault_status["vault_paragraphs"] > 0
+                          and not vault_status["vault_degraded"]),
+            "paragraphs_loaded": vault_status["vault_paragraphs"],
+            "port": PORT,
+            "snapshot_age": snapshot_age,
+            "workers": LIMITER.status(),
+            "caches": {
+                "query_embeddings": QUERY_EMBEDDING_CACHE.stats(),
+                "recommendations": RESULT_CACHE.stats()
+            },
+            "connections": connection_stats(),
+            **vault_status
+        }
+        
+        self.send_json_response(200, response)
     
     def handle_models_list(self):
-        """Список доступных моделей"""
-        try:
-            result = subprocess.run(
-                ['ollama', 'list'],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            models = []
-            if result.returncode == 0:
-                lines = result.stdout.strip().split('\n')
-                for line in lines[1:]:
-                    if line:
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            models.append(parts[0])
-            
-            self.send_json_response(200, {"models": models})
-            
-        except Exception as e:
-            self.send_json_response(500, {"error": str(e)})
+        """Список доступных моделей (из последнего опроса Ollama)"""
+        snapshot, snapshot_age = OLLAMA_PROBE.snapshot()
+        self.send_json_response(200, {
+            "models": snapshot["models"],
+            "ollama": snapshot["ollama"],
+            "snapshot_age": snapshot_age
+        })
+    
+    def handle_metrics(self):
+        """Метрики в текстовом формате Prometheus (без очереди LIMITER)"""
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_cors_headers()
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def profile_requested(self):
+        """Профилирование запроса: ?profile=1 или заголовок X-Profile: 1"""
+        query = parse_qs(urlparse(self.path).query)
+        return profile_requested(query.get('profile'), self.headers.get('X-Profile'))
     
     def handle_recommendations(self):
         """ГЛАВНОЕ: Получение рекомендаций через RAG"""
         print(f"\n📨 POST /api/get_recommendations")
         
+        with request_profile(self.profile_requested(), "recommendations", PROFILE_DUMP_DIR) as profile:
+            self.recommendations_response(profile)
+    
+    def recommendations_response(self, profile=None):
+        """Ответ /api/get_recommendations; profile - разбивка времени по этапам (если запрошена)"""
         try:
             # 1. Читаем данные запроса
-            content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
+            request_data = self.read_json_body()
             
             diagnosis = request_data.get('diagnosis', '').strip()
             patient_data = request_data.get('patient_data', {})
             model = request_data.get('model', 'mistral:7b')
+            use_cache = request_data.get('use_cache', True)
             
             if not diagnosis:
                 self.send_json_response(400, {"error": "Diagnosis is required"})
                 return
+            if not isinstance(use_cache, bool):
+                self.send_json_response(400, {"error": "use_cache must be a boolean", "success": False})
+                return
             
             print(f"🤖 Диагноз: {diagnosis}")
             print(f"📊 Данных пациента: {len(patient_data)} полей")
             
-            # 2. СОЗДАЕМ АССИСТЕНТА С RAG
-            print("🔄 Инициализация MedicalAssistant с RAG...")
-            assistant = MedicalAssistant(model=model)
+            with timed("vault"):
+                vault = VAULT.get()
+            response = get_recommendation(vault, diagnosis, patient_data, model, use_cache)
+            if profile is not None:
+                response = {**response, "profile": profile.summary()}
+            self.send_json_response(200, response)
             
-            # 3. ЗАГРУЖАЕМ ДАННЫЕ ПАЦИЕНТА
-            assistant.patient_data = patient_data
+        except Exception as e:
+            print(f"❌ Ошибка: {e}")
+            import traceback
+            traceback.print_exc()
             
-            # 4. ЗАГРУЖАЕМ ВСЕ ПАРАГРАФЫ ЛЕЧЕНИЯ
-            print("📚 Загрузка параграфов лечения...")
-            assistant.vault_content = assistant.load_all_treatment_content()
-            print(f"✅ Загружено {len(assistant.vault_content)} параграфов")
+            # Возвращаем понятную ошибку
+            self.send_json_response(500, {
+                "error": str(e),
+                "success": False
+            })
+    
+    def handle_recommendations_stream(self):
+        """Потоковые рекомендации через Server-Sent Events"""
+        print(f"\n📨 POST /api/get_recommendations/stream")
+        
+        try:
+            request_data = self.read_json_body()
             
-            # 5. ГЕНЕРИРУЕМ ЭМБЕДДИНГИ
-            if assistant.vault_content:
-                print("🔧 Генерация эмбеддингов...")
-                assistant.vault_embeddings_tensor = assistant.generate_embeddings(
-                    assistant.vault_content
-                )
-                print(f"✅ Эмбеддинги готовы")
+            diagnosis = request_data.get('diagnosis', '').strip()
+            patient_data = request_data.get('patient_data', {})
+            model = request_data.get('model', 'mistral:7b')
             
-            # 6. ПОЛУЧАЕМ РЕКОМЕНДАЦИЮ ЧЕРЕЗ RAG
-            print("🧠 Запрос к модели с RAG...")
-            start_time = time.time()
+            if not diagnosis:
+                self.send_json_response(400, {"error": "Diagnosis is required"})
+                return
             
-            recommendation = assistant.get_treatment_recommendation()
+            print(f"🤖 Диагноз: {diagnosis}")
             
-            processing_time = time.time() - start_time
+            assistant = MedicalAssistant(model=model)
+            assistant.patient_data = patient_data
+            with timed("vault"):
+                VAULT.get().attach(assistant)
             
-            # 7. ОТПРАВЛЯЕМ ОТВЕТ
-            response = {
-                "success": True,
-                "diagnosis": diagnosis,
-                "recommendation": recommendation,
-                "processing_time": round(processing_time, 2),
-                "model": model,
-                "rag_used": len(assistant.vault_content) > 0,
-                "paragraphs_used": len(assistant.vault_content)
-            }
+        except Exception as e:
+            print(f"❌ Ошибка: {e}")
+            self.send_json_response(500, {"error": str(e), "success": False})
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_cors_headers()
+        self.end_headers()
+        
+        start_time = time.time()
+        
+        try:
+            for event, data in assistant.get_treatment_recommendation_stream():
+                if event == "context":
+                    data = {
+                        **data,
+                        "diagnosis": diagnosis,
+                        "model": model,
+                        "rag_used": len(assistant.vault_content) > 0,
+                        "paragraphs_used": len(assistant.vault_content)
+                    }
+                elif event in ("done", "error"):
+                    data = {
+                        **data,
+                        "success": event == "done",
+                        "processing_time": round(time.time() - start_time, 2)
+                    }
+                self.send_sse_event(event, data)
             
-            print(f"✅ Ответ получен за {processing_time:.1f}с, {len(recommendation)} символов")
-            self.send_json_response(200, response)
+            print(f"✅ Поток завершен за {time.time() - start_time:.1f}с")
             
+        except (BrokenPipeError, ConnectionResetError):
+            print("⚠️ Клиент закрыл соединение во время генерации")
         except Exception as e:
             print(f"❌ Ошибка: {e}")
-            import traceback
-            traceback.print_exc()
-            
-            # Возвращаем понятную ошибку
-            self.send_json_response(500, {
-                "error": str(e),
+            try:
+                self.send_sse_event("error", {"error": str(e), "success": False})
+            except OSError:
+                pass
+    
+    def handle_recommendations_batch(self):
+        """
+        Рекомендации для списка пациентов одним запросом
+        Общая база, один пакет эмбеддингов запросов, ограниченное число параллельных генераций.
+        Ошибка в одной записи не прерывает пакет: у каждого результата свой статус
+        """
+        print(f"\n📨 POST /api/get_recommendations/batch")
+        
+        try:
+            request_data = self.read_json_body()
+        except (ValueError, UnicodeDecodeError) as e:
+            self.send_json_response(400, {"error": f"Invalid JSON: {e}", "success": False})
+            return
+        
+        records = request_data.get('items') if isinstance(request_data, dict) else None
+        if not isinstance(records, list) or not records:
+            self.send_json_response(400, {"error": "items must be a non-empty list", "success": False})
+            return
+        if len(records) > BATCH_MAX_ITEMS:
+            self.send_json_response(413, {
+                "error": f"Too many items: {len(records)} > {BATCH_MAX_ITEMS}",
                 "success": False
             })
+            return
+        
+        default_model = request_data.get('model', 'mistral:7b')
+        use_cache = request_data.get('use_cache', True)
+        if not isinstance(use_cache, bool):
+            self.send_json_response(400, {"error": "use_cache must be a boolean", "success": False})
+            return
+        try:
+            concurrency = max(1, min(int(request_data.get('concurrency', BATCH_CONCURRENCY)),
+                                     BATCH_CONCURRENCY))
+        except (TypeError, ValueError):
+            concurrency = BATCH_CONCURRENCY
+        start_time = time.time()
+        
+        # Проверка записей: некорректные сразу получают статус ошибки
+        results = [None] * len(records)
+        valid = []
+        for position, record in enumerate(records):
+            if not isinstance(record, dict):
+                error = "Record must be an object"
+            elif not str(record.get('diagnosis', '')).strip():
+                error = "Diagnosis is required"
+            elif not isinstance(record.get('patient_data', {}), dict):
+                error = "patient_data must be an object"
+            else:
+                valid.append({
+                    "index": position,
+                    "diagnosis": str(record['diagnosis']).strip(),
+                    "patient_data": record.get('patient_data', {}),
+                    "model": record.get('model', default_model)
+                })
+                continue
+            results[position] = {"index": position, "status": "error", "success": False,
+                                 "error": error, "processing_time": 0.0}
+        
+        print(f"📦 Пакет: {len(records)} записей, {len(valid)} корректных, параллельно до {concurrency}")
+        
+        try:
+            with timed("vault"):
+                vault = VAULT.get()
+            
+            # Ответы из кэша - сразу; генерация и эмбеддинги запросов - только для остальных
+            to_generate = []
+            for item in valid:
+                cached = None
+                if use_cache:
+                    with timed("cache"):
+                        cached = cached_recommendation(
+                            vault,
+                            recommendation_cache_key(vault, item["diagnosis"], item["patient_data"], item["model"])
+                        )
+                if cached is None:
+                    to_generate.append(item)
+                    continue
+                results[item["index"]] = {"index": item["index"], "status": "ok", **cached,
+                                          "success": True, "cached": True, "processing_time": 0.0}
+            if valid:
+                print(f"⚡ Из кэша: {len(valid) - len(to_generate)}/{len(valid)}")
+            
+            if to_generate:
+                with timed("embedding"):
+                    prefill_query_embeddings(to_generate)
+        except Exception as e:
+            print(f"❌ Ошибка подготовки пакета: {e}")
+            self.send_json_response(500, {"error": str(e), "success": False})
+            return
+        
+        def run_item(item):
+            item_start = time.time()
+            try:
+                # Кэш уже проверен при разборе пакета
+                response = get_recommendation(
+                    vault, item["diagnosis"], item["patient_data"], item["model"], use_cache=False
+                )
+                failed = response["recommendation"].startswith("❌")
+                return {"index": item["index"], "status": "error" if failed else "ok", **response,
+                        "success": not failed}
+            except Exception as e:
+                print(f"❌ Запись {item['index']}: {e}")
+                return {"index": item["index"], "status": "error", "success": False,
+                        "diagnosis": item["diagnosis"], "error": str(e),
+                        "processing_time": round(time.time() - item_start, 2)}
+        
+        # Пакет уже занимает один слот LIMITER; параллельные генерации сверх него -
+        # только на свободных слотах, чтобы одновременных запросов к модели не было больше --workers
+        extra_slots = LIMITER.acquire_free(min(concurrency, len(to_generate)) - 1) if to_generate else 0
+        try:
+            with ThreadPoolExecutor(max_workers=1 + extra_slots) as pool:
+                # map сохраняет порядок записей
+                for result in pool.map(run_item, to_generate):
+                    results[result["index"]] = result
+        finally:
+            if extra_slots:
+                LIMITER.release(extra_slots)
+        
+        succeeded = sum(1 for result in results if result["success"])
+        processing_time = time.time() - start_time
+        print(f"✅ Пакет готов за {processing_time:.1f}с: {succeeded}/{len(results)} успешно")
+        
+        self.send_json_response(200, {
+            "success": succeeded == len(results),
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "processing_time": round(processing_time, 2),
+            "results": results
+        })
+    
+    def handle_solve(self):
+        """
+        Подбор лечения решателем по клиническим рекомендациям (без LLM)
+        Тело: {"patient_data": {...}} (как в /api/get_recommendations) или
+        {"case": <история болезни v.4>}; необязательно "diagnosis"
+        """
+        try:
+            request_data = self.read_json_body()
+        except (ValueError, UnicodeDecodeError) as e:
+            self.send_json_response(400, {"error": f"Invalid JSON: {e}", "success": False})
+            return
+        if not isinstance(request_data, dict):
+            self.send_json_response(400, {"error": "Request body must be a JSON object", "success": False})
+            return
+        
+        try:
+            patient_data = request_data.get('patient_data')
+            if patient_data is None and request_data.get('case') is not None:
+                with timed("parse"):
+                    patient_data = MedicalAssistant().parse_patient_data_adaptive(request_data['case'])
+            if not isinstance(patient_data, dict):
+                self.send_json_response(400, {"error": "patient_data or case is required", "success": False})
+                return
+            
+            diagnosis = str(request_data.get('diagnosis') or '').strip() or None
+            with timed("solve"):
+                result = get_solver().solve(patient_data, diagnosis)
+            print(f"🧩 Решатель: {result['disease']}, вариантов {len(result['treatment_options'])} "
+                  f"за {result['processing_time_ms']} мс")
+            self.send_json_response(200, {"success": not result["errors"], **result})
+            
+        except Exception as e:
+            print(f"❌ Ошибка решателя: {e}")
+            self.send_json_response(500, {"error": str(e), "success": False})
+    
+    def read_json_body(self):
+        """Чтение JSON тела запроса"""
+        with timed("parse"):
+            content_length = int(self.headers.get('Content-Length', 0))
+            post_data = self.rfile.read(content_length)
+            return json.loads(post_data.decode('utf-8'))
+    
+    def send_sse_event(self, event, data):
+        """Отправка одного события Server-Sent Events"""
+        payload = json.dumps(data, ensure_ascii=False)
+        self.wfile.write(f"event: {event}\ndata: {payload}\n\n".encode('utf-8'))
+        self.wfile.flush()
     
     def send_json_response(self, status_code, data):
         """Отправка JSON ответа"""
@@ -195,8 +613,37 @@ class MedicalAPIHandler(http.server.BaseHTTPRequestHandler):
         self.wfile.write(json_str.encode('utf-8'))
 
 
-def run_server():
+def parse_args():
+    """Параметры запуска сервера"""
+    parser = argparse.ArgumentParser(description='API сервер медицинского ассистента')
+    parser.add_argument('--port', type=int, default=PORT, help='Порт сервера')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS,
+                        help='Сколько запросов рекомендаций обрабатывается одновременно')
+    parser.add_argument('--queue-size', type=int, default=SERVER_QUEUE_SIZE,
+                        help='Сколько запросов рекомендаций может ждать в очереди (дальше - 503)')
+    parser.add_argument('--retry-after', type=int, default=SERVER_RETRY_AFTER,
+                        help='Значение Retry-After (секунды) при переполненной очереди')
+    parser.add_argument('--result-cache-dir', default=RESULT_CACHE_DIR,
+                        help='Папка для дискового кэша рекомендаций (по умолчанию только память)')
+    parser.add_argument('--single-threaded', action='store_true',
+                        help='Старый режим: один запрос за раз')
+    parser.add_argument('--profile-dir', default=PROFILE_DIR,
+                        help='Папка для файлов cProfile запросов с ?profile=1 (по умолчанию без cProfile)')
+    return parser.parse_args()
+
+
+def run_server(port=PORT, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE_SIZE,
+               retry_after=SERVER_RETRY_AFTER, result_cache_dir=RESULT_CACHE_DIR,
+               single_threaded=False, profile_dir=PROFILE_DIR):
     """Запуск сервера"""
+    global PORT, LIMITER, RETRY_AFTER, RESULT_CACHE, PROFILE_DUMP_DIR
+    PORT = port
+    LIMITER = RequestLimiter(workers, queue_size)
+    RETRY_AFTER = retry_after
+    RESULT_CACHE = RecommendationCache(disk_dir=result_cache_dir)
+    PROFILE_DUMP_DIR = profile_dir
+    
+    mode = "последовательный" if single_threaded else f"параллельный ({workers} слота, очередь {queue_size})"
     print(f"""
     {'='*60}
     🚀 МЕДИЦИНСКИЙ AI СЕРВЕР С RAG
@@ -204,11 +651,26 @@ def run_server():
     📍 Порт: {PORT}
     🤖 Модель: mistral:7b
     📚 Режим: RAG (поиск по параграфам)
+    🧵 Обработка: {mode}
     {'='*60}
     """)
     
+    # Строим базу параграфов в фоне, сервер отвечает сразу
+    VAULT.build_in_background()
+    # Ollama снова отвечает - догружаем эмбеддинги, не полученные при построении базы
+    OLLAMA_PROBE.on_recovered(lambda: VAULT.repair_in_background(force=True))
+    OLLAMA_PROBE.start()
+    
+    # База знаний решателя компилируется за миллисекунды - сразу при запуске
+    try:
+        get_solver()
+    except Exception as e:
+        print(f"⚠️ Решатель недоступен: {e}")
+    
+    server_class = socketserver.TCPServer if single_threaded else ThreadingMedicalServer
+    
     try:
-        with socketserver.TCPServer(("127.0.0.1", PORT), MedicalAPIHandler) as httpd:
+        with server_class(("127.0.0.1", PORT), MedicalAPIHandler) as httpd:
             httpd.allow_reuse_address = True
             print(f"✅ Сервер запущен на порту {PORT}")
             print(f"⏳ Ожидание запросов...\n")
@@ -221,4 +683,13 @@ def run_server():
 
 
 if __name__ == "__main__":
-    run_server()
\ No newline at end of file
+    args = parse_args()
+    run_server(
+        port=args.port,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        retry_after=args.retry_after,
+        result_cache_dir=args.result_cache_dir,
+        single_threaded=args.single_threaded,
+        profile_dir=args.profile_dir
+    )
@@ -0,0 +1,586 @@
+"""
+Решатель по клиническим рекомендациям (КлинРек II ур) без LLM
+Порт MedicalDecisionSystem из «решатель 3.0.py»: база знаний один раз компилируется
+в плоские записи инструкций с готовыми условиями, подбор лечения - проход по записям заболевания
+"""
+import threading
+import time
+
+from config import KB_PATH, KB_SNAPSHOT
+from kb_snapshot import load_snapshot, read_json
+from partitions import match_partitions
+
+KB_ROOT = "КлинРек II ур"
+
+# Вид снимка скомпилированной базы: менять версию при изменении compile_knowledge_base
+SOLVER_SNAPSHOT_KIND = "solver-v1"
+
+# Поля истории болезни, которые отвечают условию с другим названием
+FIELD_ALIASES = {
+    "диагноз": ("клинический диагноз", "сопутствующий диагноз"),
+}
+
+# Разделы «Категории пациента» помимо Фактора и Наблюдения: ключи - допустимые значения
+EXTRA_CONDITION_KEYS = ("Стадия", "Временной аспект", "Неготовность")
+
+
+def normalize_value(value):
+    return " ".join(str(value).lower().split())
+
+
+def parse_number(value):
+    """Число из значения истории болезни ('66', '36,6', '65.0'); None, если не число"""
+    try:
+        return float(str(value).replace(",", ".").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def render_node(node):
+    """Читаемый текст узла плана лечения: {'ИАПФ': {}, 'ББ': {}} -> 'ИАПФ, ББ'"""
+    if isinstance(node, dict):
+        if not node:
+            return ""
+        if all(value in ({}, None, "") for value in node.values()):
+            return ", ".join(node)
+        parts = []
+        for key, value in node.items():
+            text = render_node(value)
+            parts.append(f"{key}: {text}" if text and text != key else key)
+        return "; ".join(parts)
+    if isinstance(node, list):
+        return ", ".join(render_node(item) for item in node)
+    return str(node)
+
+
+class Condition:
+    """
+    Одно готовое к проверке условие инструкции
+    kind: 'any_of' - значение из множества, 'range' - число в границах, 'present' - поле заполнено
+    """
+    __slots__ = ("section", "path", "label", "kind", "values", "low", "high", "expected")
+
+    def __init__(self, section, path, kind, values=(), low=None, high=None):
+        self.section = section
+        self.path = tuple(normalize_value(part) for part in path)
+        self.label = " / ".join(path)
+        self.kind = kind
+        self.values = frozenset(normalize_value(value) for value in values)
+        self.low = float("-inf") if low is None else float(low)
+        self.high = float("inf") if high is None else float(high)
+        # Список чисел ['65.0', '79.0'] в качественном значении - это диапазон
+        numbers = [parse_number(value) for value in values]
+        if kind == "any_of" and len(numbers) == 2 and None not in numbers:
+            self.low, self.high = min(numbers), max(numbers)
+        if kind == "range":
+            self.expected = f"{low if low is not None else '-∞'}-{high if high is not None else '∞'}"
+        else:
+            self.expected = sorted(values) if kind == "any_of" else "заполнено"
+
+    def evaluate(self, patient_values):
+        """
+        Args:
+            patient_values (list): Нормализованные значения пациента для self.path (None - нет данных)
+
+        Returns:
+            str: 'match', 'mismatch' или 'missing'
+        """
+        if patient_values is None:
+            return "missing"
+        if self.kind == "present":
+            return "match"
+        if self.kind == "any_of" and any(value in self.values for value in patient_values):
+            return "match"
+        if self.kind == "range" or self.low != float("-inf") or self.high != float("inf"):
+            for value in patient_values:
+                number = parse_number(value)
+                if number is not None and self.low <= number <= self.high:
+                    return "match"
+        return "mismatch"
+
+
+def compile_value_spec(section, path, spec):
+    """
+    Условия из описания значения в базе знаний
+    (качественное значение / Качественное значение / Числовое значение / Характеристика)
+
+    Returns:
+        list: Кортежи (раздел, путь, вид, значения, нижняя граница, верхняя граница) -
+            аргументы Condition; только простые типы, чтобы сохраняться в снимок
+    """
+    if not isinstance(spec, dict) or not spec:
+        return [(section, path, "present", (), None, None)]
+
+    conditions = []
+    for key, value in spec.items():
+        if key == "качественное значение":
+            values = value if isinstance(value, list) else [value]
+            conditions.append((section, path, "any_of", tuple(values), None, None))
+        elif key == "Качественное значение":
+            values = list(value) if isinstance(value, dict) else [value]
+            conditions.append((section, path, "any_of", tuple(values), None, None))
+        elif key == "Числовое значение":
+            if value.get("значение") and "нижняя граница" not in value and "верхняя граница" not in value:
+                conditions.append((section, path, "any_of", tuple(value["значение"]), None, None))
+            else:
+                conditions.append((
+                    section, path, "range", (),
+                    value.get("нижняя граница"), value.get("верхняя граница")
+                ))
+        elif key == "Характеристика" and isinstance(value, dict):
+            for characteristic, characteristic_spec in value.items():
+                conditions.extend(compile_value_spec(section, path + (characteristic,), characteristic_spec))
+    return conditions or [(section, path, "present", (), None, None)]
+
+
+def compile_conditions(category):
+    """Все условия «Категории пациента» одной инструкции (кортежи для Condition)"""
+    if not isinstance(category, dict):
+        return []
+
+    conditions = []
+    for factor, spec in (category.get("Фактор") or {}).items():
+        conditions.extend(compile_value_spec("Фактор", (factor,), spec))
+
+    for observation in category.get("Наблюдение") or []:
+        if isinstance(observation, dict):
+            for name, spec in observation.items():
+                conditions.extend(compile_value_spec("Наблюдение", (name,), spec))
+
+    for key in EXTRA_CONDITION_KEYS:
+        spec = category.get(key)
+        if spec is None:
+            continue
+        values = list(spec) if isinstance(spec, dict) else [spec]
+        kind = "any_of" if values else "present"
+        conditions.append((key, (key,), kind, tuple(values), None, None))
+
+    return conditions
+
+
+def compile_goals(plan):
+    """Цели лечения в читаемом виде: 'Снизить Систолическое артериальное давление (120.0-139.0)'"""
+    goals = []
+    for goal in (plan.get("Цель") or {}).values():
+        if not isinstance(goal, dict):
+            continue
+        for action, target in goal.items():
+            if isinstance(target, dict) and isinstance(target.get("Наблюдение"), list):
+                names = []
+                for observation in target["Наблюдение"]:
+                    for name, spec in observation.items():
+                        numeric = spec.get("Числовое значение", {}) if isinstance(spec, dict) else {}
+                        bounds = [numeric.get("нижняя граница"), numeric.get("верхняя граница")]
+                        if any(bound is not None for bound in bounds):
+                            low, high = (bound if bound is not None else "" for bound in bounds)
+                            name = f"{name} ({low}-{high})"
+                        names.append(name)
+                text = ", ".join(names)
+            else:
+                text = render_node(target)
+            goals.append(f"{action.capitalize()} {text}".strip())
+    return goals
+
+
+def compile_treatments(plan):
+    """Варианты лечения: [{'type': 'медикаментозное', 'description': 'Фарм-группа: ИАПФ, ББ'}]"""
+    treatments = []
+    for option in (plan.get("вариант лечения") or {}).values():
+        if not isinstance(option, dict):
+            continue
+        for treatment_type, details in option.items():
+            treatments.append({"type": treatment_type, "description": render_node(details)})
+    return treatments
+
+
+def compile_knowledge_base(knowledge_base):
+    """
+    Разбор базы знаний в плоские записи инструкций из простых типов (сохраняются в снимок)
+
+    Returns:
+        dict: {"diseases": [...], "records": [(заболевание, группа, вариант, условия,
+            цели, лечение, примечания), ...]}
+    """
+    diseases = (knowledge_base.get(KB_ROOT) or {}).get("Заболевание") or {}
+    records = []
+    for disease, disease_node in diseases.items():
+        for group, variants in (disease_node or {}).items():
+            if not isinstance(variants, dict):
+                continue
+            for variant, variant_node in variants.items():
+                instructions = variant_node.get("Инструкция") if isinstance(variant_node, dict) else None
+                for instruction in (instructions or {}).values():
+                    plan = instruction.get("План лечебных действий") or {}
+                    notes = [
+                        render_node(plan[key])
+                        for key in ("описание лечения в зависимости от обстоятельств", "место проведения")
+                        if plan.get(key)
+                    ]
+                    records.append((
+                        disease, group, variant,
+                        compile_conditions(instruction.get("Категория пациента")),
+                        compile_goals(plan),
+                        compile_treatments(plan),
+                        notes
+                    ))
+    return {"diseases": list(diseases), "records": records}
+
+
+class InstructionRecord:
+    """Скомпилированная инструкция: условия, цели и лечение в готовом виде"""
+    __slots__ = ("id", "disease", "group", "variant", "conditions", "goals", "treatments", "notes")
+
+    def __init__(self, record_id, disease, group, variant, conditions, goals, treatments, notes):
+        self.id = record_id
+        self.disease = disease
+        self.group = group
+        self.variant = variant
+        self.conditions = [Condition(*condition) for condition in conditions]
+        self.goals = goals
+        self.treatments = treatments
+        self.notes = notes
+
+
+class PatientFacts:
+    """
+    Данные пациента в виде для проверки условий
+    Поля истории болезни плоские: 'Опыт терапии_ПВТ (противовирусной терапии)', 'Результат', ...
+    """
+
+    def __init__(self, patient_data):
+        self.fields = {}
+        self._collect(patient_data or {}, ())
+        self.components = {key: key.split("_") for key in self.fields}
+        self._lookups = {}
+
+    def _collect(self, data, prefix):
+        for key, value in data.items():
+            if isinstance(value, dict) and "Значение" not in value:
+                self._collect(value, prefix + (key,))
+                continue
+            if isinstance(value, dict):
+                value = value["Значение"]
+            values = value if isinstance(value, list) else [value]
+            values = [normalize_value(item) for item in values if item not in (None, "")]
+            if values:
+                field = normalize_value("_".join(prefix + (key,)))
+                self.fields.setdefault(field, []).extend(values)
+
+    def lookup(self, path):
+        """
+        Значения пациента для пути условия (фактор[, характеристика])
+        Порядок: точное имя поля -> поле с фактором и характеристикой -> только характеристика
+
+        Returns:
+            list или None, если данных нет
+        """
+        if path not in self._lookups:
+            self._lookups[path] = self._lookup(path)
+        return self._lookups[path]
+
+    def _lookup(self, path):
+        exact = self.fields.get("_".join(path))
+        if exact is not None:
+            return exact
+
+        name = path[-1]
+        names = (name,) + FIELD_ALIASES.get(name, ())
+        scoped, bare = [], []
+        for field, parts in self.components.items():
+            if parts[-1] in names:
+                if len(path) > 1 and path[0] in parts[:-1]:
+                    scoped.extend(self.fields[field])
+                else:
+                    bare.extend(self.fields[field])
+        return scoped or bare or None
+
+    def number(self, *names):
+        """Первое числовое значение среди полей с такими названиями"""
+        for name in names:
+            for value in self.lookup((normalize_value(name),)) or []:
+                number = parse_number(value)
+                if number is not None:
+                    return number
+        return None
+
+
+class ConditionIndex:
+    """
+    Обратный индекс условий инструкций одного заболевания:
+    (путь условия, значение или диапазон) -> условия, которые выполняются при таком значении
+    Проверяются только пути, встречающиеся в условиях, - по одному обращению к данным пациента
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.by_value = {}  # (путь, значение) -> [(позиция инструкции, номер условия)]
+        self.ranges = {}  # путь -> [(нижняя граница, верхняя граница, (позиция, номер))]
+        self.present = {}  # путь -> [(позиция, номер)] - достаточно заполненного поля
+        self.paths = []
+
+        for position, record in enumerate(records):
+            for number, condition in enumerate(record.conditions):
+                key = (position, number)
+                if condition.path not in self.paths:
+                    self.paths.append(condition.path)
+                if condition.kind == "present":
+                    self.present.setdefault(condition.path, []).append(key)
+                    continue
+                for value in condition.values:
+                    self.by_value.setdefault((condition.path, value), []).append(key)
+                if condition.kind == "range" or condition.low != float("-inf") or condition.high != float("inf"):
+                    self.ranges.setdefault(condition.path, []).append((condition.low, condition.high, key))
+
+    def match_counts(self, facts):
+        """
+        Число выполненных условий для инструкций, где выполнено хотя бы одно
+        (те же правила, что в Condition.evaluate)
+
+        Returns:
+            dict: {позиция инструкции: число выполненных условий}
+        """
+        matched = set()
+        for path in self.paths:
+            patient_values = facts.lookup(path)
+            if patient_values is None:
+                continue
+            matched.update(self.present.get(path, ()))
+            for value in patient_values:
+                matched.update(self.by_value.get((path, value), ()))
+            ranges = self.ranges.get(path)
+            if ranges:
+                for value in patient_values:
+                    number = parse_number(value)
+                    if number is not None:
+                        matched.update(key for low, high, key in ranges if low <= number <= high)
+
+        counts = {}
+        for position, _ in matched:
+            counts[position] = counts.get(position, 0) + 1
+        return counts
+
+
+class ClinicalSolver:
+    def __init__(self, compiled):
+        """
+        Args:
+            compiled (dict): Результат compile_knowledge_base (из JSON или из снимка)
+        """
+        start_time = time.time()
+        self.records = []
+        self.by_disease = {disease: [] for disease in compiled["diseases"]}
+        for record_id, record in enumerate(compiled["records"]):
+            record = InstructionRecord(record_id, *record)
+            self.records.append(record)
+            self.by_disease[record.disease].append(record)
+        self.indexes = {disease: ConditionIndex(records) for disease, records in self.by_disease.items()}
+
+        self.diseases = list(compiled["diseases"])
+        self._disease_keys = {normalize_value(disease): disease for disease in self.diseases}
+        self.compile_time = time.time() - start_time
+
+    @classmethod
+    def from_knowledge_base(cls, knowledge_base):
+        """Решатель из уже разобранного JSON базы знаний"""
+        return cls(compile_knowledge_base(knowledge_base))
+
+    @classmethod
+    def from_file(cls, path=KB_PATH, use_snapshot=KB_SNAPSHOT):
+        """
+        Решатель из файла базы знаний
+        Скомпилированные записи берутся из снимка рядом с файлом (без разбора JSON),
+        снимок пересобирается при изменении файла
+        """
+        start_time = time.time()
+        if use_snapshot:
+            compiled = load_snapshot(path, SOLVER_SNAPSHOT_KIND, lambda: compile_knowledge_base(read_json(path)))
+        else:
+            compiled = compile_knowledge_base(read_json(path))
+        solver = cls(compiled)
+        solver.compile_time = time.time() - start_time
+        return solver
+
+    def determine_disease(self, diagnoses):
+        """
+        Заболевание базы знаний по диагнозам пациента:
+        точное совпадение -> вхождение строки -> совпадение основ слов
+        """
+        diagnoses = [diagnosis for diagnosis in diagnoses if diagnosis]
+        for diagnosis in diagnoses:
+            disease = self._disease_keys.get(normalize_value(diagnosis))
+            if disease:
+                return disease
+
+        for diagnosis in diagnoses:
+            text = normalize_value(diagnosis)
+            for key, disease in self._disease_keys.items():
+                if text in key or key in text:
+                    return disease
+
+        for diagnosis in diagnoses:
+            matched = match_partitions(diagnosis, self.diseases)
+            if matched:
+                return matched[0]
+        return None
+
+    def evaluate(self, record, facts):
+        """Проверка пациента по условиям инструкции (как _check_patient_match)"""
+        matches, mismatches, missing = [], [], []
+        for condition in record.conditions:
+            patient_values = facts.lookup(condition.path)
+            status = condition.evaluate(patient_values)
+            if status == "match":
+                matches.append(f"{condition.section} '{condition.label}': соответствует")
+            elif status == "missing":
+                missing.append(f"Отсутствует информация ({condition.section.lower()}): {condition.label}")
+            else:
+                mismatches.append(
+                    f"{condition.section} '{condition.label}': значение {patient_values} "
+                    f"не соответствует ожидаемому {condition.expected}"
+                )
+
+        total = len(record.conditions)
+        return {
+            "match_score": int(len(matches) / total * 100) if total else 0,
+            "matches": matches,
+            "mismatches": mismatches,
+            "missing_data": missing
+        }
+
+    def treatment_option(self, record, evaluation):
+        return {
+            "instruction_id": record.id,
+            "variant": record.variant,
+            "variant_group": record.group,
+            "goals": record.goals,
+            "treatments": record.treatments,
+            "notes": record.notes,
+            **evaluation
+        }
+
+    def find_treatment_options(self, disease, facts):
+        """Оценка всех инструкций заболевания (полный перебор - эталон для индекса)"""
+        return [
+            self.treatment_option(record, self.evaluate(record, facts))
+            for record in self.by_disease.get(disease, [])
+        ]
+
+    def best_treatment_options(self, disease, facts):
+        """
+        То же, что rank(find_treatment_options(...)), через обратный индекс:
+        оценки считаются только для инструкций с выполненными условиями,
+        подробная проверка - только для отобранных
+        """
+        records = self.by_disease.get(disease, [])
+        if not records:
+            return []
+
+        scored = []
+        for position, count in sorted(self.indexes[disease].match_counts(facts).items()):
+            score = int(count / len(records[position].conditions) * 100)
+            if score:
+                scored.append({"match_score": score, "position": position})
+        # Ни одного совпадения: у всех инструкций 0, rank выбрал бы первую
+        selected = self.rank(scored) or [{"position": 0}]
+
+        return [
+            self.treatment_option(records[option["position"]], self.evaluate(records[option["position"]], facts))
+            for option in selected
+        ]
+
+    def rank(self, options):
+        """Лучшие варианты: полные совпадения (до 3), иначе ≥80% (до 2), ≥50% (1) или лучший из остальных"""
+        options = sorted(options, key=lambda option: option["match_score"], reverse=True)
+        for low, limit in ((100, 3), (80, 2), (50, 1), (0, 1)):
+            selected = [option for option in options if option["match_score"] >= low]
+            if selected:
+                return selected[:limit]
+        return []
+
+    def warnings(self, facts, diagnoses):
+        """Предупреждения по критическим показателям (как _check_for_warnings)"""
+        warnings = []
+
+        sbp = facts.number("Систолическое артериальное давление")
+        if sbp is not None:
+            if sbp > 140:
+                warnings.append(f"Повышенное систолическое давление: {sbp:g} мм рт.ст.")
+            elif sbp < 90:
+                warnings.append(f"Пониженное систолическое давление: {sbp:g} мм рт.ст.")
+
+        dbp = facts.number("Диастолическое артериальное давление")
+        if dbp is not None:
+            if dbp > 90:
+                warnings.append(f"Повышенное диастолическое давление: {dbp:g} мм рт.ст.")
+            elif dbp < 60:
+                warnings.append(f"Пониженное диастолическое давление: {dbp:g} мм рт.ст.")
+
+        hr = facts.number("Частота сердечных сокращений")
+        if hr is not None:
+            if hr > 100:
+                warnings.append(f"Тахикардия: ЧСС {hr:g} уд/мин")
+            elif hr < 50:
+                warnings.append(f"Брадикардия: ЧСС {hr:g} уд/мин")
+
+        normalized = {normalize_value(diagnosis) for diagnosis in diagnoses}
+        if "цирроз печени" in normalized and normalized & {"аг", "артериальная гипертензия"}:
+            warnings.append("Сочетание цирроза печени и артериальной гипертензии требует особого подхода к лечению")
+
+        return warnings
+
+    def solve(self, patient_data, diagnosis=None):
+        """
+        Подбор лечения для пациента (как process_patient_case)
+
+        Args:
+            patient_data (dict): Плоские данные пациента {поле: {"Значение": ...}} или {поле: значение}
+            diagnosis (str): Диагноз, если не указан в данных
+
+        Returns:
+            dict: diagnosis, disease, treatment_options, warnings, errors, processing_time_ms
+        """
+        start_time = time.perf_counter()
+        result = {
+            "diagnosis": diagnosis,
+            "disease": None,
+            "treatment_options": [],
+            "warnings": [],
+            "errors": []
+        }
+
+        facts = PatientFacts(patient_data)
+        diagnoses = [diagnosis] if diagnosis else []
+        diagnoses += facts.lookup(("диагноз",)) or []
+        if not result["diagnosis"] and diagnoses:
+            result["diagnosis"] = diagnoses[0]
+
+        result["disease"] = self.determine_disease(diagnoses)
+        if not result["disease"]:
+            result["errors"].append("Не удалось определить основной диагноз")
+        else:
+            options = self.best_treatment_options(result["disease"], facts)
+            if options:
+                result["treatment_options"] = options
+            else:
+                result["errors"].append("Для данного диагноза не найдено рекомендаций в базе знаний")
+            result["warnings"] = self.warnings(facts, diagnoses)
+
+        result["processing_time_ms"] = round((time.perf_counter() - start_time) * 1000, 3)
+        return result
+
+
+_solver = None
+_solver_lock = threading.Lock()
+
+
+def get_solver():
+    """Решатель на процесс: база знаний компилируется при первом обращении"""
+    global _solver
+    if _solver is None:
+        with _solver_lock:
+            if _solver is None:
+                solver = ClinicalSolver.from_file(KB_PATH)
+                print(f"🧩 База знаний загружена за {solver.compile_time * 1000:.1f} мс: "
+                      f"{len(solver.diseases)} заболеваний, {len(solver.records)} инструкций")
+                _solver = solver
+    return _solver
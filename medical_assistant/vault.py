@@ -0,0 +1,299 @@
+"""
+Общая для процесса база параграфов лечения (vault)
+Строится один раз при старте сервера и переиспользуется всеми запросами
+"""
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from ann import build_vector_index
+from config import CACHE_DIR, DATA_DIR, VAULT_REPAIR_INTERVAL
+from core import MedicalAssistant
+from lexical import LexicalIndex
+from partitions import disease_from_filename, match_partitions
+
+
+def data_files(data_dir=DATA_DIR):
+    """Файлы параграфов лечения в стабильном порядке"""
+    if not os.path.isdir(data_dir):
+        return []
+    return sorted(
+        os.path.join(data_dir, filename)
+        for filename in os.listdir(data_dir)
+        if filename.endswith('.txt')
+    )
+
+
+def data_fingerprint(data_dir=DATA_DIR):
+    """Дешевый отпечаток папки data (имена, размеры, время изменения) для проверки устаревания"""
+    fingerprint = []
+    for filepath in data_files(data_dir):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            continue
+        fingerprint.append((os.path.basename(filepath), stat.st_size, stat.st_mtime_ns))
+    return tuple(fingerprint)
+
+
+def data_versions(data_dir=DATA_DIR):
+    """
+    Версии базы по содержимому файлов параграфов
+
+    Returns:
+        tuple: (версия всей базы, {заболевание: версия раздела})
+    """
+    digest = hashlib.sha256()
+    partition_versions = {}
+    for filepath in data_files(data_dir):
+        with open(filepath, 'rb') as f:
+            file_hash = hashlib.sha256(f.read()).hexdigest()
+        digest.update(os.path.basename(filepath).encode('utf-8'))
+        digest.update(file_hash.encode('ascii'))
+        partition_versions[disease_from_filename(filepath)] = file_hash[:16]
+    return digest.hexdigest()[:16], partition_versions
+
+
+class TreatmentVault:
+    def __init__(self):
+        """
+        Параграфы лечения и их эмбеддинги
+        После построения используются только для чтения
+        """
+        self.content = []
+        self.sources = []
+        self.chunks = []
+        self.embeddings = None
+        self.index = None
+        self.lexical_index = None
+        self.version = None
+        self.partition_versions = {}
+        self.fingerprint = None
+        self.build_time = None
+        self.error = None
+        # Фрагменты, для которых Ollama не вернула эмбеддинг (в матрице - нули)
+        self.missing_rows = []
+        self.ready = threading.Event()
+        self._build_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._repair_lock = threading.Lock()
+        self._last_repair = 0.0
+
+    @property
+    def degraded(self):
+        """База построена, но часть фрагментов без эмбеддингов: поиск по ним не работает"""
+        return bool(self.missing_rows)
+
+    def index_cache_path(self, version):
+        return os.path.join(CACHE_DIR, f"ann_{version}.npz")
+
+    def missing_error(self, missing, total):
+        return f"Нет эмбеддингов для {missing} из {total} фрагментов (Ollama недоступна?)"
+
+    def build(self, force=False):
+        """Загрузка параграфов и генерация эмбеддингов"""
+        with self._build_lock:
+            # Пока ждали блокировку, базу мог перестроить другой поток
+            if self.ready.is_set() and (not force or data_fingerprint() == self.fingerprint):
+                return True
+
+            print("🏗️  Построение базы параграфов лечения...")
+            start_time = time.time()
+
+            try:
+                fingerprint = data_fingerprint()
+                version, partition_versions = data_versions()
+                assistant = MedicalAssistant()
+                paragraphs = assistant.load_treatment_paragraphs()
+                assistant.set_vault_paragraphs(paragraphs)
+                content, sources = assistant.vault_content, assistant.vault_sources
+                embeddings, chunks = assistant.embed_paragraphs(content) if content else (None, [])
+                missing_rows = list(assistant.failed_embedding_rows) if content else []
+                # Кластеризация IVF сохраняется рядом с кэшем эмбеддингов и привязана к версии базы
+                # (кроме неполной базы: нулевые строки будут заменены)
+                index = build_vector_index(
+                    embeddings, labels=[sources[chunk["parent"]]["disease"] for chunk in chunks],
+                    cache_path=None if missing_rows else self.index_cache_path(version)
+                ) if embeddings is not None else None
+                lexical_index = LexicalIndex([chunk["text"] for chunk in chunks])
+            except Exception as e:
+                self.error = str(e)
+                print(f"❌ Ошибка построения базы параграфов: {e}")
+                return False
+
+            # Подменяем состояние целиком: запросы видят либо старую, либо новую базу
+            with self._state_lock:
+                self.content = content
+                self.sources = sources
+                self.chunks = chunks
+                self.embeddings = embeddings
+                self.index = index
+                self.lexical_index = lexical_index
+                self.version = version
+                self.partition_versions = partition_versions
+                self.fingerprint = fingerprint
+                self.missing_rows = missing_rows
+            self.build_time = time.time() - start_time
+            self.error = self.missing_error(len(missing_rows), len(chunks)) if missing_rows else None
+            self._last_repair = time.time()
+            self.ready.set()
+
+            if missing_rows:
+                print(f"⚠️ База параграфов построена неполной за {self.build_time:.1f}с: {self.error}; "
+                      f"повторная попытка - при восстановлении Ollama")
+            else:
+                print(f"✅ База параграфов готова за {self.build_time:.1f}с: "
+                      f"{len(content)} параграфов, {len(chunks)} фрагментов, версия {version}")
+            return True
+
+    def repair(self):
+        """
+        Повторный эмбеддинг фрагментов, оставшихся без эмбеддинга при построении
+        Новая матрица и индекс подменяются целиком, как при построении
+
+        Returns:
+            bool: удалось ли получить хотя бы часть недостающих эмбеддингов
+        """
+        if not self._repair_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._state_lock:
+                rows = list(self.missing_rows)
+                chunks, sources, embeddings, version = self.chunks, self.sources, self.embeddings, self.version
+            if not rows:
+                return False
+            self._last_repair = time.time()
+
+            print(f"🔁 Повторный эмбеддинг {len(rows)} фрагментов...")
+            assistant = MedicalAssistant()
+            vectors = assistant.generate_embeddings([chunks[row]["text"] for row in rows])
+            failed = set(assistant.failed_embedding_rows)
+            if len(failed) == len(rows):
+                print("⚠️ Ollama по-прежнему не отдает эмбеддинги, база остается неполной")
+                return False
+
+            if vectors.shape[1] == embeddings.shape[1]:
+                embeddings = embeddings.copy()
+            elif len(rows) == len(embeddings):
+                # Ни одного эмбеддинга при построении: размерность задает модель
+                embeddings = np.zeros((len(rows), vectors.shape[1]), dtype=np.float32)
+            else:
+                print(f"❌ Размерность эмбеддингов изменилась ({embeddings.shape[1]} -> {vectors.shape[1]}), "
+                      f"нужно полное перестроение базы")
+                return False
+            for position, row in enumerate(rows):
+                if position not in failed:
+                    embeddings[row] = vectors[position]
+            missing_rows = [row for position, row in enumerate(rows) if position in failed]
+
+            index = build_vector_index(
+                embeddings, labels=[sources[chunk["parent"]]["disease"] for chunk in chunks],
+                cache_path=None if missing_rows else self.index_cache_path(version)
+            )
+            with self._state_lock:
+                if self.chunks is not chunks:
+                    # Пока считали, база перестроена заново
+                    return False
+                self.embeddings = embeddings
+                self.index = index
+                self.missing_rows = missing_rows
+            self.error = self.missing_error(len(missing_rows), len(chunks)) if missing_rows else None
+
+            print(f"✅ Эмбеддинги восстановлены: {len(rows) - len(missing_rows)}/{len(rows)} фрагментов")
+            return True
+        finally:
+            self._repair_lock.release()
+
+    def repair_in_background(self, force=False):
+        """
+        Запуск repair в фоновом потоке, если база неполная
+        Без force - не чаще раза в VAULT_REPAIR_INTERVAL секунд (запросы не долбят лежащую Ollama)
+        """
+        if not self.missing_rows or self._repair_lock.locked():
+            return None
+        if not force and time.time() - self._last_repair < VAULT_REPAIR_INTERVAL:
+            return None
+        thread = threading.Thread(target=self.repair, name="vault-repair", daemon=True)
+        thread.start()
+        return thread
+
+    def build_in_background(self):
+        """Запуск построения в фоновом потоке"""
+        thread = threading.Thread(target=self.build, name="vault-builder", daemon=True)
+        thread.start()
+        return thread
+
+    def refresh_if_stale(self):
+        """Перестраивает базу, если файлы в папке data изменились"""
+        if self.ready.is_set() and data_fingerprint() != self.fingerprint:
+            print("🔄 Файлы параграфов изменились, перестраиваем базу...")
+            self.build(force=True)
+
+    def get(self):
+        """
+        Ждет готовности базы и возвращает её
+        Если построение не запущено или фоновое построение упало - строит в текущем потоке
+        """
+        if not self.ready.is_set():
+            print("⏳ Ожидание построения базы параграфов...")
+            while not self.ready.wait(timeout=1.0):
+                if not self._build_lock.locked():
+                    if not self.build():
+                        raise RuntimeError(f"База параграфов не построена: {self.error}")
+        self.refresh_if_stale()
+        self.repair_in_background()
+        return self
+
+    def attach(self, assistant):
+        """Подключает готовую базу к ассистенту (без копирования)"""
+        with self._state_lock:
+            assistant.attach_vault(
+                self.content, self.embeddings, self.index, self.sources, self.chunks,
+                self.lexical_index
+            )
+        return assistant
+
+    def version_for(self, diagnosis):
+        """
+        Версия той части базы, по которой будет искаться диагноз:
+        версии его разделов, а если раздел не определен - версия всей базы
+        """
+        with self._state_lock:
+            partitions = match_partitions(diagnosis, self.partition_versions.keys())
+        return self.partitions_version(partitions)
+
+    def partitions_version(self, partitions):
+        """Версия разделов базы; пустой список (поиск по всей базе) - версия всей базы"""
+        with self._state_lock:
+            if not partitions or any(partition not in self.partition_versions for partition in partitions):
+                return self.version
+            return "+".join(
+                f"{partition}:{self.partition_versions[partition]}" for partition in sorted(partitions)
+            )
+
+    def searched_version(self, assistant):
+        """
+        Версия той части базы, по которой ассистент реально искал контекст
+
+        Returns:
+            tuple: (разделы - пустой список означает всю базу, версия)
+        """
+        partitions = [] if assistant.searched_everywhere else sorted(assistant.searched_partitions)
+        return partitions, self.partitions_version(partitions)
+
+    def status(self):
+        """Состояние базы для /api/health"""
+        return {
+            "vault_ready": self.ready.is_set(),
+            "vault_paragraphs": len(self.content),
+            "vault_chunks": len(self.chunks),
+            "vault_partitions": len(self.partition_versions),
+            "vault_version": self.version,
+            "vault_build_time": round(self.build_time, 2) if self.build_time is not None else None,
+            "vault_degraded": self.degraded,
+            "vault_missing_embeddings": len(self.missing_rows),
+            "vault_error": self.error
+        }